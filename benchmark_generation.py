@@ -0,0 +1,178 @@
+"""Бенчмарк генерации планет.
+
+Генерирует планеты нескольких радиусов для фиксированных сидов, печатает время
+стадий, точки в секунду, память и главное из статистики мира и сравнивает время
+и память с сохранённым базовым замером. Работает без Discord и токена бота:
+
+    python benchmark_generation.py                   # сравнение с базовым замером
+    python benchmark_generation.py --save-baseline   # записать новый базовый замер
+    python benchmark_generation.py --radii 25 50 --seeds 6849 --time-threshold 0.1
+
+Если время или память хуже базовых больше, чем на порог, завершается с кодом 1.
+Базовый замер зависит от машины, поэтому записывать его нужно там же,
+где потом запускается сравнение.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from data.neurosphere import profiler, worlds
+from data.neurosphere.generation_cache import GenerationCache
+from data.neurosphere.worlds import Planet
+
+PLANET_PATH = "data/neurosphere/worlds/planet0.json"
+BASELINE_PATH = "data/neurosphere/benchmarks/baseline.json"
+DEFAULT_RADII = [25, 50, 100, 200]
+DEFAULT_SEEDS = [6849, 29, 5]
+TIME_THRESHOLD = 0.25  # допустимое замедление, доля от базового времени
+MEMORY_THRESHOLD = 0.25  # допустимый рост пиковой памяти, доля от базовой
+MIN_STAGE_TIME = 0.05  # секунд; более быстрые стадии не сравниваются - слишком шумно
+
+
+def run_case(radius: int, seed: int, repeat: int) -> dict:
+    """Генерирует планету repeat раз и возвращает лучший замер"""
+    with open(PLANET_PATH, encoding="utf-8") as file:
+        planet_data = json.load(file)
+    planet_data["generation"]["radius"] = radius
+    planet_data["generation"]["seed"] = seed
+
+    best_report = None
+    for _ in range(repeat):
+        # новый пустой кэш, чтобы каждый раз замерять полную генерацию
+        with tempfile.TemporaryDirectory() as cache_directory:
+            worlds.GENERATION_CACHE = GenerationCache(cache_directory)
+            planet = Planet(json.loads(json.dumps(planet_data)))
+            planet.generate()
+        report = planet.data["generation_profile"]
+        if best_report is None or report["wall_time"] < best_report["wall_time"]:
+            best_report = report
+
+    stages = {}
+    add_stage_times(stages, best_report["stages"], "")
+    return {
+        "radius": radius,
+        "seed": seed,
+        "points": best_report["points"],
+        "wall_time": best_report["wall_time"],
+        "cpu_time": best_report["cpu_time"],
+        "points_per_second": best_report["points"] / best_report["wall_time"],
+        "peak_memory": best_report["peak_memory"],
+        "stages": stages,
+        # у одинаковых радиуса и сида миры одинаковые, берём последний
+        "statistics": planet.statistics(),
+    }
+
+
+def add_stage_times(stages: dict[str, float], records: list[dict], prefix: str) -> None:
+    """Складывает время записей профиля в stages по путям вида height/noise"""
+    for record in records:
+        name = prefix + record["name"]
+        stages[name] = stages.get(name, 0) + record["wall_time"]
+        add_stage_times(stages, record["stages"], f"{name}/")
+
+
+def compare(
+    results: dict[str, dict],
+    baseline: dict[str, dict],
+    time_threshold: float,
+    memory_threshold: float,
+) -> list[str]:
+    """Возвращает описания регрессий относительно baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+
+        checks = [("время", result["wall_time"], base["wall_time"], time_threshold)]
+        checks += [
+            (f"стадия {stage}", time, base["stages"][stage], time_threshold)
+            for stage, time in result["stages"].items()
+            if base["stages"].get(stage, 0) >= MIN_STAGE_TIME
+        ]
+        checks.append(
+            ("память", result["peak_memory"], base["peak_memory"], memory_threshold)
+        )
+        for what, value, base_value, threshold in checks:
+            if base_value > 0 and value > base_value * (1 + threshold):
+                regressions.append(
+                    f"{name}: {what} {value:.3f} против {base_value:.3f} "
+                    f"(+{value / base_value - 1:.0%}, порог {threshold:.0%})"
+                )
+    return regressions
+
+
+def print_result(name: str, result: dict, base: dict | None) -> None:
+    change = ""
+    if base is not None:
+        change = f" ({result['wall_time'] / base['wall_time'] - 1:+.0%})"
+    print(
+        f"{name}: {result['wall_time']:.2f}с{change}, CPU {result['cpu_time']:.2f}с, "
+        f"{result['points']} точек, {result['points_per_second']:.0f} точек/с, "
+        f"{result['peak_memory'] / 1024**2:.1f} МБ"
+    )
+    for stage, time in result["stages"].items():
+        print(f"{'    ' * (stage.count('/') + 1)}{stage}: {time:.3f}с")
+    statistics = result["statistics"]
+    print(
+        f"    суша {statistics['land_share']:.1%}, горы {statistics['mountain_share']:.1%}, "
+        f"{statistics['plates']} плит, {len(statistics['biome_shares'])} биомов"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк генерации планет")
+    parser.add_argument("--radii", type=int, nargs="+", default=DEFAULT_RADII)
+    parser.add_argument("--seeds", type=int, nargs="+", default=DEFAULT_SEEDS)
+    parser.add_argument("--repeat", type=int, default=1, help="замеров на случай")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD)
+    parser.add_argument("--memory-threshold", type=float, default=MEMORY_THRESHOLD)
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    profiler.TRACE_MEMORY = True  # память сравнивается с базовым замером
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    results = {}
+    for radius in args.radii:
+        for seed in args.seeds:
+            name = f"radius_{radius}_seed_{seed}"
+            results[name] = run_case(radius, seed, args.repeat)
+            print_result(name, results[name], baseline.get(name))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump({**baseline, **results}, file, indent=2)
+        print(f"Базовый замер сохранён: {args.baseline}")
+        return 0
+
+    if not baseline:
+        print(f"Нет базового замера {args.baseline}, сравнивать не с чем")
+        return 0
+
+    regressions = compare(results, baseline, args.time_threshold, args.memory_threshold)
+    for regression in regressions:
+        print(f"РЕГРЕССИЯ {regression}")
+    if not regressions:
+        print("Регрессий нет")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 import asyncio
 import contextlib
+import io
 import json
 import logging
 import traceback
@@ -13,21 +14,32 @@ from data.neurosphere.objects import (
     Controller,
     Item,
     Location,
+    LocationHolder,
     PlayerController,
+    ProgressCallback,
     World,
     embeds_are_equal,
     new_id,
 )
-from data.neurosphere.worlds import Planet
+from data.neurosphere.profiler import format_report, report_to_json
+from data.neurosphere.rendering import LAYERS
+from data.neurosphere.statistics import format_statistics
+from data.neurosphere.storage import format_storage_report
+from data.neurosphere.worlds import Planet, TiledPlanet
 
-WORLD_TYPES: dict[str, type[World]] = {"planet": Planet}
+WORLD_TYPES: dict[str, type[World]] = {"planet": Planet, "tiled_planet": TiledPlanet}
 CONTROLLER_TYPES: dict[str, type[Controller]] = {"player": PlayerController}
+PROGRESS_UPDATE_INTERVAL = 2  # секунд между изменениями сообщения о загрузке
+PROFILE_MESSAGE_LENGTH = 1900  # сообщение Discord не длиннее 2000 символов
 
 
 class Neurosphere:
-    def __init__(self, name="neurosphere0"):
+    def __init__(self, name="neurosphere0", progress: ProgressCallback | None = None):
+        """Загружает Нейросферу и генерирует несгенерированные миры и персонажей.
+        Может идти долго, поэтому из бота вызывается в отдельном потоке,
+        а о ходе загрузки сообщает через progress."""
         self.worlds: dict[int, World] = {}
-        self.locations: dict[int, Location] = {}
+        self.locations = LocationHolder()
         self.characters: dict[int, Character] = {}
         self.items: dict[int, Item] = {}
 
@@ -38,7 +50,9 @@ class Neurosphere:
         self._time: int = 0
         self._tick_time: float = 1
         self._tick_task: asyncio.Task | None = None
+        self._progress = progress
 
+        self._report_progress("чтение файла", 0)
         with open(f"data/neurosphere/neurospheres/{name}.json", encoding="utf-8") as f:
             data = json.load(f)
 
@@ -99,12 +113,19 @@ class Neurosphere:
 
     # region JSON Методы
 
+    def _report_progress(self, stage: str, fraction: float) -> None:
+        if self._progress is not None:
+            self._progress(stage, fraction)
+
     def _read_data(self, data: dict) -> None:
         # первыми негенерируемые объекты, чтобы id не перезаписывались
+        self._report_progress("загрузка локаций", 0)
         self._read_locations(data["locations"])
         self._read_items(data["items"])
 
+        self._report_progress("загрузка миров", 0)
         self._read_worlds(data["worlds"])
+        self._report_progress("загрузка персонажей", 1)
         self._read_characters(data["characters"])
         self._read_players(data["players"])
         self._time = data["time"]
@@ -116,6 +137,7 @@ class Neurosphere:
             if world_data["id"] is not None:
                 world_class = WORLD_TYPES[world_data["type"]]
                 world = world_class(world_data)
+                world.attach_locations(self.locations)
                 self.worlds[world_data["id"]] = world
             else:
                 not_generated_worlds.append(world_data)
@@ -159,10 +181,14 @@ class Neurosphere:
 
     def write_data(self, name: str) -> None:
         """Сохраняет Нейросферу как json в data/neurosphere/neurospheres/{name}.json
+        Большие массивы миров сохраняются рядом в data/neurosphere/neurospheres/{name}/
 
         Args:
             name (str): Название json файла (без .json)
         """
+        for world_id, world in self.worlds.items():
+            world.write_arrays(f"data/neurosphere/neurospheres/{name}/world_{world_id}")
+
         active_player_characters = []
         for character_id, character in self.characters.items():
             controller = self.controllers[character_id]
@@ -203,7 +229,12 @@ class Neurosphere:
         world_data["id"] = new_id_
         world_class = WORLD_TYPES[world_data["type"]]
         world = world_class(world_data)
-        world.generate()
+        world.generate(
+            lambda stage, fraction: self._report_progress(
+                f"генерация мира {new_id_}: {stage}", fraction
+            )
+        )
+        self._report_progress(f"генерация локаций мира {new_id_}", 1)
         world.generate_locations(self.locations)
         self.worlds[new_id(self.worlds)] = world
 
@@ -428,6 +459,7 @@ class NeurosphereCog(commands.Cog):
         self.bot = bot
         self.neurosphere: Neurosphere | None = None
         self.game_channels: dict[int, int] = {}  # id юзера: id канала
+        self._launching: bool = False
 
     @commands.slash_command(
         name="neurosphere",
@@ -442,10 +474,44 @@ class NeurosphereCog(commands.Cog):
         if self.neurosphere:
             await inter.response.send_message("Нейросфера уже запущена", ephemeral=True)
             return
+        if self._launching:
+            await inter.response.send_message(
+                "Нейросфера уже загружается", ephemeral=True
+            )
+            return
+        self._launching = True
         await inter.response.defer()
-        self.neurosphere = Neurosphere(name)
+
+        progress = ("чтение файла", 0.0)
+
+        def report_progress(stage: str, fraction: float) -> None:
+            # вызывается из потока загрузки
+            nonlocal progress
+            progress = stage, fraction
+
+        # загрузка и генерация идут в отдельном потоке, чтобы бот не зависал
+        task = asyncio.create_task(asyncio.to_thread(Neurosphere, name, report_progress))
+        try:
+            shown_text = None
+            while not task.done():
+                await asyncio.wait({task}, timeout=PROGRESS_UPDATE_INTERVAL)
+                stage, fraction = progress
+                text = f"Загрузка Нейросферы: {stage} ({fraction:.0%})"
+                if task.done() or text == shown_text:
+                    continue
+                with contextlib.suppress(disnake.HTTPException):
+                    await inter.edit_original_response(text)
+                shown_text = text
+            self.neurosphere = task.result()
+        except Exception as e:
+            logging.error(f"Neurosphere launch error: {e}\n{traceback.format_exc()}")
+            await inter.edit_original_response("Не удалось запустить Нейросферу")
+            return
+        finally:
+            self._launching = False
+
         await self.neurosphere.start_ticking()
-        await inter.followup.send("Нейросфера запущена")
+        await inter.edit_original_response("Нейросфера запущена")
 
     @commands.slash_command(
         name="save-neurosphere",
@@ -469,6 +535,106 @@ class NeurosphereCog(commands.Cog):
         self.neurosphere.write_data(name)
         await inter.response.send_message("Нейросфера сохранена")
 
+    @commands.slash_command(
+        name="neurosphere-profile",
+        description="Профиль генерации мира Нейросферы",
+        guild_ids=GUILD_IDS,
+    )
+    @owner_only()
+    async def show_generation_profile(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        world_id: int = 0,
+    ) -> None:
+        if self.neurosphere is None:
+            await inter.response.send_message("Нейросфера не запущена", ephemeral=True)
+            return
+        world = self.neurosphere.worlds.get(world_id)
+        if world is None:
+            await inter.response.send_message("Такого мира нет", ephemeral=True)
+            return
+        report = world.data.get("generation_profile")
+        if report is None:
+            await inter.response.send_message(
+                "Мир не генерировался, профиля нет", ephemeral=True
+            )
+            return
+
+        text = format_report(report)
+        if "storage_report" in world.data:
+            text += f"\n\n{format_storage_report(world.data['storage_report'])}"
+        if len(text) > PROFILE_MESSAGE_LENGTH:
+            text = text[:PROFILE_MESSAGE_LENGTH] + "\n..."
+        file = disnake.File(
+            io.BytesIO(report_to_json(report).encode("utf-8")),
+            filename=f"generation_profile_world_{world_id}.json",
+        )
+        await inter.response.send_message(f"```\n{text}\n```", file=file, ephemeral=True)
+
+    @commands.slash_command(
+        name="neurosphere-stats",
+        description="Статистика мира Нейросферы",
+        guild_ids=GUILD_IDS,
+    )
+    @owner_only()
+    async def show_world_statistics(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        world_id: int = 0,
+    ) -> None:
+        if self.neurosphere is None:
+            await inter.response.send_message("Нейросфера не запущена", ephemeral=True)
+            return
+        world = self.neurosphere.worlds.get(world_id)
+        if world is None:
+            await inter.response.send_message("Такого мира нет", ephemeral=True)
+            return
+        await inter.response.defer(ephemeral=True)
+        # у старых сохранений статистика считается по всем точкам
+        statistics = await asyncio.to_thread(world.statistics)
+        if statistics is None:
+            await inter.edit_original_response("У этого мира нет статистики")
+            return
+
+        text = format_statistics(statistics)
+        if len(text) > PROFILE_MESSAGE_LENGTH:
+            text = text[:PROFILE_MESSAGE_LENGTH] + "\n..."
+        file = disnake.File(
+            io.BytesIO(
+                json.dumps(statistics, ensure_ascii=False, indent=2).encode("utf-8")
+            ),
+            filename=f"statistics_world_{world_id}.json",
+        )
+        await inter.edit_original_response(f"```\n{text}\n```", file=file)
+
+    @commands.slash_command(
+        name="map",
+        description="Карта мира Нейросферы",
+        guild_ids=GUILD_IDS,
+    )
+    async def show_map(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        layer: str = commands.Param(default="biome", choices=list(LAYERS)),
+        world_id: int = 0,
+    ) -> None:
+        if self.neurosphere is None:
+            await inter.response.send_message("Нейросфера не запущена", ephemeral=True)
+            return
+        world = self.neurosphere.worlds.get(world_id)
+        if world is None:
+            await inter.response.send_message("Такого мира нет", ephemeral=True)
+            return
+        await inter.response.defer()
+        # в первый раз карта рисуется - не в потоке бота
+        path = await asyncio.to_thread(world.render_map, layer)
+        if path is None:
+            await inter.edit_original_response("У этого мира нет карты")
+            return
+        await inter.edit_original_response(
+            file=disnake.File(path, filename=f"world_{world_id}_{layer}.png")
+        )
+
     @commands.slash_command(
         name="play",
         description="Играть в Нейросфере",
@@ -0,0 +1,123 @@
+"""Индекс точек мира по биомам.
+
+Точки хранятся одним массивом, упорядоченным по биому, как граф соседей
+в CSR: точки биома biome_id - point_ids[offsets[biome_id]:offsets[biome_id + 1]].
+Случайная точка биома выбирается за O(1), а смена биома точки занимает
+не больше перестановок, чем биомов между старым и новым.
+"""
+
+import numpy as np
+
+
+class BiomeIndex:
+    """Точки каждого биома и случайный выбор среди них.
+
+    Args:
+        biome_map: id биома каждой точки.
+        biomes_number: Сколько всего биомов.
+        rng: Генератор случайных чисел для sample, по умолчанию новый.
+    """
+
+    def __init__(
+        self,
+        biome_map: np.ndarray,
+        biomes_number: int,
+        rng: np.random.Generator | None = None,
+    ):
+        # один генератор на все выборки: создавать его дольше, чем выбирать точку
+        self._rng = rng or np.random.default_rng()
+        biome_map = np.asarray(biome_map)
+        self.point_ids = np.argsort(biome_map, kind="stable")
+        self._positions = np.empty_like(self.point_ids)  # point_id -> место в point_ids
+        self._positions[self.point_ids] = np.arange(len(self.point_ids))
+        self.offsets = np.zeros(biomes_number + 1, dtype=np.int64)
+        np.cumsum(np.bincount(biome_map, minlength=biomes_number), out=self.offsets[1:])
+
+    def count(self, biome_id: int) -> int:
+        return int(self.offsets[biome_id + 1] - self.offsets[biome_id])
+
+    def get_point_ids(self, biome_id: int) -> np.ndarray:
+        return self.point_ids[self.offsets[biome_id] : self.offsets[biome_id + 1]]
+
+    def sample(
+        self, weights: dict[int, float], size: int | None = None
+    ) -> np.ndarray | int | None:
+        """Случайные точки биомов из weights.
+
+        Args:
+            weights: id биома -> вес одной его точки. Биом выбирается с вероятностью,
+                пропорциональной весу, умноженному на число его точек.
+            size: Сколько точек выбрать. Если None - одна точка числом.
+
+        Returns:
+            id точек (с повторами) или None, если у биомов нет точек.
+        """
+        biome_ids = np.fromiter(weights, dtype=np.int64, count=len(weights))
+        counts = self.offsets[biome_ids + 1] - self.offsets[biome_ids]
+        biome_weights = np.fromiter(weights.values(), dtype=np.float64) * counts
+        total_weight = biome_weights.sum()
+        if total_weight <= 0:
+            return None
+
+        if len(biome_ids) == 1:
+            chosen = np.zeros(size, dtype=np.intp) if size is not None else 0
+        else:
+            chosen = self._rng.choice(
+                len(biome_ids), size=size, p=biome_weights / total_weight
+            )
+        positions = self.offsets[biome_ids[chosen]] + self._rng.integers(counts[chosen])
+        if size is None:
+            return int(self.point_ids[positions])
+        return self.point_ids[positions]
+
+    def sample_among(
+        self, weights: dict[int, float], size: int, allowed: np.ndarray
+    ) -> np.ndarray | None:
+        """Как sample, но только среди точек, у которых allowed[point_id] истинно.
+        Перебирает точки биомов, поэтому дольше sample.
+
+        Returns:
+            id точек (с повторами) или None, если у биомов нет разрешённых точек.
+        """
+        point_ids = [self.get_point_ids(biome_id) for biome_id in weights]
+        point_ids = [
+            biome_point_ids[allowed[biome_point_ids]] for biome_point_ids in point_ids
+        ]
+        point_weights = np.repeat(
+            np.fromiter(weights.values(), dtype=np.float64),
+            [len(biome_point_ids) for biome_point_ids in point_ids],
+        )
+        total_weight = point_weights.sum()
+        if total_weight <= 0:
+            return None
+        return self._rng.choice(
+            np.concatenate(point_ids), size=size, p=point_weights / total_weight
+        )
+
+    def move(self, point_id: int, biome_id: int) -> None:
+        """Переносит точку в биом biome_id"""
+        position = int(self._positions[point_id])
+        biome = int(np.searchsorted(self.offsets, position, side="right")) - 1
+        # точка переставляется на край своего отрезка, и граница отрезков
+        # сдвигается за неё - так она оказывается в соседнем биоме
+        while biome < biome_id:
+            last = int(self.offsets[biome + 1]) - 1
+            self._swap(position, last)
+            position = last
+            self.offsets[biome + 1] -= 1
+            biome += 1
+        while biome > biome_id:
+            first = int(self.offsets[biome])
+            self._swap(position, first)
+            position = first
+            self.offsets[biome] += 1
+            biome -= 1
+
+    def _swap(self, position_1: int, position_2: int) -> None:
+        point_ids = self.point_ids
+        point_ids[position_1], point_ids[position_2] = (
+            point_ids[position_2],
+            point_ids[position_1],
+        )
+        self._positions[point_ids[position_1]] = position_1
+        self._positions[point_ids[position_2]] = position_2
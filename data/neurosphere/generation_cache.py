@@ -0,0 +1,105 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from collections.abc import Callable
+
+CACHE_DIRECTORY = "data/neurosphere/cache"
+MAX_CACHE_SIZE = 2 * 1024**3  # байт
+MAX_CACHE_AGE = 30 * 24 * 60 * 60  # секунд
+
+
+class GenerationCache:
+    """Кэш сгенерированных миров на диске.
+
+    Каждая запись - папка, названная хэшем параметров генерации. Что лежит внутри,
+    решает мир: кэш только находит, сохраняет и удаляет записи.
+    Давно не использованные записи удаляются по возрасту и по общему размеру кэша.
+    """
+
+    def __init__(
+        self,
+        directory: str = CACHE_DIRECTORY,
+        max_size: int = MAX_CACHE_SIZE,
+        max_age: float = MAX_CACHE_AGE,
+    ):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+
+    @staticmethod
+    def key(world_type: str, generation: dict, version: int) -> str:
+        """Хэш типа мира, параметров генерации (вместе с сидом) и версии генератора"""
+        description = json.dumps(
+            {"type": world_type, "generation": generation, "version": version},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Возвращает папку записи или None, если такой записи нет"""
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(path):
+            return None
+        os.utime(path)  # запись использована - она не удалится первой
+        return path
+
+    def put(self, key: str, write: Callable[[str], None]) -> str:
+        """Создаёт запись: write(папка) сохраняет в папку всё нужное.
+
+        Запись сначала пишется во временную папку и появляется целиком,
+        поэтому недописанную запись никто не прочитает.
+        """
+        path = os.path.join(self.directory, key)
+        temporary_path = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(temporary_path, exist_ok=True)
+        try:
+            write(temporary_path)
+            os.rename(temporary_path, path)
+        except OSError:
+            # запись с таким ключом уже успели создать
+            shutil.rmtree(temporary_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        except Exception:
+            shutil.rmtree(temporary_path, ignore_errors=True)
+            raise
+        self.evict()
+        return path
+
+    def evict(self) -> None:
+        """Удаляет записи старше max_age, затем самые давние, пока кэш больше max_size"""
+        if not os.path.isdir(self.directory):
+            return
+
+        entries = []  # (время использования, размер, путь)
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if ".tmp-" in name or not os.path.isdir(path):
+                continue
+            used_time = os.path.getmtime(path)
+            if now - used_time > self.max_age:
+                self._remove(path)
+                continue
+            entries.append((used_time, self._size(path), path))
+
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _size(path: str) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        logging.info(f"Удаление из кэша генерации: {path}")
+        shutil.rmtree(path, ignore_errors=True)
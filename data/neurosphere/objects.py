@@ -1,6 +1,7 @@
 import colorsys
 import logging
 import random
+from collections.abc import Callable
 from typing import TYPE_CHECKING
 
 import disnake
@@ -8,6 +9,9 @@ import disnake
 if TYPE_CHECKING:
     from cogwheels.neurosphere import Neurosphere
 
+# (название этапа, доля выполненной работы от 0 до 1)
+ProgressCallback = Callable[[str, float], None]
+
 
 class Essence:
     def __init__(self, data: dict):
@@ -37,6 +41,9 @@ class Location(Essence):
     def get_world_id(self):
         return self.data["world_id"]
 
+    def set_biome(self, biome: str) -> None:
+        self.data["biome"] = biome
+
     def add_character_id(self, char_id: int) -> None:
         characters: list[int] = self.data["references"]["characters"]
         if char_id in characters:
@@ -50,6 +57,69 @@ class Location(Essence):
         characters.remove(char_id)
 
 
+class LocationHolder(dict):
+    """Словарь id -> Location, в котором миры заранее резервируют непрерывные
+    диапазоны id для своих локаций (reserve). Location создаётся при первом
+    обращении к id и дальше хранится как обычный элемент словаря.
+
+    Ключи, значения и длина - только у созданных локаций, и в json сохраняются
+    только они: остальные мир создаст заново таким же образом.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._next_id = 0
+        # (первый id, id после последнего, функция id -> Location)
+        self._ranges: list[tuple[int, int, Callable[[int], Location]]] = []
+
+    def reserve(
+        self, number: int, create: Callable[[int], Location], first: int | None = None
+    ) -> int:
+        """Резервирует number id подряд начиная с first (по умолчанию - после всех
+        занятых) и возвращает первый из них. Локации создаются через create(id)."""
+        if first is None:
+            first = self._next_id
+        self._ranges.append((first, first + number, create))
+        self._next_id = max(self._next_id, first + number)
+        return first
+
+    def get_next_id(self) -> int:
+        """id после всех созданных и зарезервированных"""
+        return self._next_id
+
+    def _find_create(self, location_id: int) -> Callable[[int], Location] | None:
+        for first, stop, create in self._ranges:
+            if first <= location_id < stop:
+                return create
+        return None
+
+    def __setitem__(self, location_id: int, location: Location) -> None:
+        super().__setitem__(location_id, location)
+        self._next_id = max(self._next_id, location_id + 1)
+
+    def __missing__(self, location_id: int) -> Location:
+        create = self._find_create(location_id)
+        if create is None:
+            raise KeyError(location_id)
+        location = create(location_id)
+        self[location_id] = location
+        return location
+
+    def __contains__(self, location_id) -> bool:
+        return super().__contains__(location_id) or (
+            self._find_create(location_id) is not None
+        )
+
+    def get(self, location_id: int, default=None):
+        if location_id not in self:
+            return default
+        return self[location_id]
+
+    def get_created(self, location_id: int) -> Location | None:
+        """Уже созданная локация или None, не создавая её"""
+        return super().get(location_id)
+
+
 class Item(Essence):
     def __init__(self, data: dict):
         super().__init__(data)
@@ -125,12 +195,14 @@ class World(Essence):
     def __init__(self, data):
         super().__init__(data)
 
-    def generate(self) -> None:
-        """Генерирует всё, чтобы мир смог сгенерировать карту локаций."""
+    def generate(self, progress: ProgressCallback | None = None) -> None:  # noqa
+        """Генерирует всё, чтобы мир смог сгенерировать карту локаций.
+        Если передан progress, сообщает через него о ходе генерации."""
         logging.error(f"Метод generate в {type(self)} не реализован")
 
-    def generate_locations(self, location_holder: dict[int, Location]) -> None:  # noqa
-        """Генерирует локации и добавляет их к location_holder."""
+    def generate_locations(self, location_holder: LocationHolder) -> None:  # noqa
+        """Генерирует локации и добавляет их к location_holder
+        или резервирует для них id в нём."""
         logging.error(f"Метод generate_locations в {type(self)} не реализован")
 
     def generate_character(
@@ -143,6 +215,32 @@ class World(Essence):
         Генерирует его предметы и добавляет их к item_holder."""
         logging.error(f"Метод generate_character в {type(self)} не реализован")
 
+    def find_route(
+        self,
+        start_location_id: int,  # noqa: ARG002
+        goal_location_id: int,  # noqa: ARG002
+    ) -> list[int] | None:
+        """Возвращает id локаций пути от начальной до конечной включительно
+        или None, если пути нет."""
+        logging.error(f"Метод find_route в {type(self)} не реализован")
+
+    def render_map(self, layer: str) -> str | None:  # noqa: ARG002
+        """Возвращает путь к PNG карте мира со слоем layer"""
+        logging.error(f"Метод render_map в {type(self)} не реализован")
+
+    def statistics(self) -> dict | None:
+        """Возвращает статистику мира для настройки генерации"""
+        logging.error(f"Метод statistics в {type(self)} не реализован")
+
+    def write_arrays(self, directory: str) -> None:
+        """Сохраняет большие массивы мира в бинарные файлы в directory,
+        чтобы не хранить их в json. Мирам без таких массивов делать ничего не нужно."""
+
+    def attach_locations(self, location_holder: LocationHolder) -> None:
+        """Даёт загруженному миру словарь локаций Нейросферы, чтобы он снова
+        зарезервировал в нём id своих локаций. Мирам, которые создают все локации
+        в generate_locations, делать ничего не нужно."""
+
     # region Методы действий
 
     def update_item_commands(self, character: Character, ns: "Neurosphere") -> None:  # noqa
@@ -225,6 +323,8 @@ def generate_pleasant_color() -> tuple[int, int, int]:
 
 
 def new_id(holder: dict) -> int:
+    if isinstance(holder, LocationHolder):
+        return holder.get_next_id()
     if not holder:
         return 0
     return max(holder.keys()) + 1
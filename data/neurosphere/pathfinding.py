@@ -0,0 +1,77 @@
+"""Поиск путей по графу соседей точек мира.
+
+Граф хранится в формате CSR: соседи точки point_id -
+point_ids[offsets[point_id]:offsets[point_id + 1]], а weights - стоимости
+этих рёбер. Путь ищется алгоритмом Дейкстры из scipy, последние найденные
+пути хранятся в кэше.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+ROUTE_CACHE_SIZE = 1024  # путей
+
+
+class PathFinder:
+    """Самые дешёвые пути по взвешенному графу точек.
+
+    Дейкстра на C обходит весь граф планеты за миллисекунды,
+    это быстрее A* с эвристикой, написанного на Python.
+
+    Args:
+        offsets: Начала списков соседей, длина - число точек + 1.
+        point_ids: Соседи всех точек подряд.
+        weights: Стоимости рёбер, выровненные по point_ids, больше нуля.
+        cache_size: Сколько последних путей хранить.
+    """
+
+    def __init__(
+        self,
+        offsets: np.ndarray,
+        point_ids: np.ndarray,
+        weights: np.ndarray,
+        cache_size: int = ROUTE_CACHE_SIZE,
+    ):
+        points_number = len(offsets) - 1
+        # копия: eliminate_zeros меняет массивы матрицы на месте
+        self._graph = csr_matrix(
+            (weights, point_ids, offsets), shape=(points_number, points_number), copy=True
+        )
+        # рёбра точек в себя имеют нулевую стоимость и не нужны
+        self._graph.eliminate_zeros()
+        self._cache_size = cache_size
+        self._cache: OrderedDict[tuple[int, int], tuple[list[int], float] | None] = (
+            OrderedDict()
+        )
+
+    def find_path(self, start: int, goal: int) -> tuple[list[int], float] | None:
+        """Самый дешёвый путь из точки start в точку goal.
+
+        Returns:
+            Точки пути от start до goal включительно и его стоимость
+            или None, если goal недостижима.
+        """
+        key = (start, goal)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        path = self._search(start, goal)
+        self._cache[key] = path
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return path
+
+    def _search(self, start: int, goal: int) -> tuple[list[int], float] | None:
+        costs, previous = dijkstra(self._graph, indices=start, return_predecessors=True)
+        if np.isinf(costs[goal]):
+            return None
+
+        path = [goal]
+        while path[-1] != start:
+            path.append(int(previous[path[-1]]))
+        path.reverse()
+        return path, float(costs[goal])
@@ -0,0 +1,184 @@
+"""Векторизованный 3D шум Перлина.
+
+Повторяет noise.pnoise3 (та же таблица перестановок, те же градиенты и
+вычисления во float32), но считает сразу массив точек (N, 3), поэтому
+результат совпадает с библиотекой noise бит в бит.
+"""
+
+from collections.abc import Iterable
+
+import numpy as np
+
+# таблица перестановок из noise/_noise.h
+_PERM_256 = [
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225, 140, 36,
+    103, 30, 69, 142, 8, 99, 37, 240, 21, 10, 23, 190, 6, 148, 247, 120, 234, 75, 0,
+    26, 197, 62, 94, 252, 219, 203, 117, 35, 11, 32, 57, 177, 33, 88, 237, 149, 56,
+    87, 174, 20, 125, 136, 171, 168, 68, 175, 74, 165, 71, 134, 139, 48, 27, 166,
+    77, 146, 158, 231, 83, 111, 229, 122, 60, 211, 133, 230, 220, 105, 92, 41, 55,
+    46, 245, 40, 244, 102, 143, 54, 65, 25, 63, 161, 1, 216, 80, 73, 209, 76, 132,
+    187, 208, 89, 18, 169, 200, 196, 135, 130, 116, 188, 159, 86, 164, 100, 109,
+    198, 173, 186, 3, 64, 52, 217, 226, 250, 124, 123, 5, 202, 38, 147, 118, 126,
+    255, 82, 85, 212, 207, 206, 59, 227, 47, 16, 58, 17, 182, 189, 28, 42, 223, 183,
+    170, 213, 119, 248, 152, 2, 44, 154, 163, 70, 221, 153, 101, 155, 167, 43, 172,
+    9, 129, 22, 39, 253, 19, 98, 108, 110, 79, 113, 224, 232, 178, 185, 112, 104,
+    218, 246, 97, 228, 251, 34, 242, 193, 238, 210, 144, 12, 191, 179, 162, 241, 81,
+    51, 145, 235, 249, 14, 239, 107, 49, 192, 214, 31, 181, 199, 106, 157, 184, 84,
+    204, 176, 115, 121, 50, 45, 127, 4, 150, 254, 138, 236, 205, 93, 222, 114, 67,
+    29, 24, 72, 243, 141, 128, 195, 78, 66, 215, 61, 156, 180,
+]  # fmt: skip
+PERM = np.array(_PERM_256 * 2, dtype=np.int64)
+
+GRAD3 = np.array(
+    [
+        [1, 1, 0], [-1, 1, 0], [1, -1, 0], [-1, -1, 0],
+        [1, 0, 1], [-1, 0, 1], [1, 0, -1], [-1, 0, -1],
+        [0, 1, 1], [0, -1, 1], [0, 1, -1], [0, -1, -1],
+        [1, 0, -1], [-1, 0, -1], [0, -1, 1], [0, 1, 1],
+    ],
+    dtype=np.float32,
+)  # fmt: skip
+
+REPEAT = 1024
+PERSISTENCE = np.float32(0.5)
+LACUNARITY = np.float32(2.0)
+_INT_MIN = -(2**31)
+
+
+def _grad3(hash_, x, y, z):
+    gradient = GRAD3[hash_ & 15]
+    return x * gradient[:, 0] + y * gradient[:, 1] + z * gradient[:, 2]
+
+
+def _lerp(t, a, b):
+    return a + t * (b - a)
+
+
+def _fade(t):
+    return t * t * t * (t * (t * np.float32(6) - np.float32(15)) + np.float32(10))
+
+
+def _lattice(coordinate, repeat: np.float32):
+    """Индексы ячейки и дробная часть по одной оси, как в noise3 из noise"""
+    i = np.floor(np.fmod(coordinate, repeat)).astype(np.int64)
+    ii = np.fmod((i + 1).astype(np.float32), repeat).astype(np.int64)
+    return i & 255, ii & 255, coordinate - np.floor(coordinate)
+
+
+def _noise3(x, y, z, repeat: int):
+    repeat = np.float32(repeat)
+    i, ii, x = _lattice(x, repeat)
+    j, jj, y = _lattice(y, repeat)
+    k, kk, z = _lattice(z, repeat)
+    fx, fy, fz = _fade(x), _fade(y), _fade(z)
+
+    a = PERM[i]
+    aa = PERM[a + j]
+    ab = PERM[a + jj]
+    b = PERM[ii]
+    ba = PERM[b + j]
+    bb = PERM[b + jj]
+
+    one = np.float32(1)
+    return _lerp(
+        fz,
+        _lerp(
+            fy,
+            _lerp(fx, _grad3(PERM[aa + k], x, y, z), _grad3(PERM[ba + k], x - one, y, z)),
+            _lerp(
+                fx,
+                _grad3(PERM[ab + k], x, y - one, z),
+                _grad3(PERM[bb + k], x - one, y - one, z),
+            ),
+        ),
+        _lerp(
+            fy,
+            _lerp(
+                fx,
+                _grad3(PERM[aa + kk], x, y, z - one),
+                _grad3(PERM[ba + kk], x - one, y, z - one),
+            ),
+            _lerp(
+                fx,
+                _grad3(PERM[ab + kk], x, y - one, z - one),
+                _grad3(PERM[bb + kk], x - one, y - one, z - one),
+            ),
+        ),
+    )
+
+
+def _octave_repeat(frequency: np.float32) -> int:
+    repeat = REPEAT * float(frequency)
+    # в C (int) от переполненного float на x86 даёт INT_MIN
+    return int(repeat) if repeat < 2**31 else _INT_MIN
+
+
+def pnoise3_octaves(points: np.ndarray, octaves: Iterable[int]) -> dict[int, np.ndarray]:
+    """Считает noise.pnoise3 для всех точек сразу для каждого числа октав из octaves.
+
+    Октавы с меньшей частотой общие для всех значений octaves,
+    поэтому все значения считаются за один проход до max(octaves).
+
+    Args:
+        points: Массив (N, 3) декартовых координат.
+        octaves: Числа октав, для которых нужен шум.
+
+    Returns:
+        Словарь: число октав -> массив (N,) значений шума.
+    """
+    octaves = set(octaves)
+    if any(octave < 1 for octave in octaves):
+        raise ValueError("Expected octaves value > 0")
+
+    points = np.asarray(points, dtype=np.float32)
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+
+    output = {}
+    frequency = np.float32(1)
+    amplitude = np.float32(1)
+    max_amplitude = np.float32(0)
+    total = np.zeros(len(points), dtype=np.float32)
+    for octave in range(1, max(octaves, default=0) + 1):
+        repeat = _octave_repeat(frequency)
+        total += _noise3(x * frequency, y * frequency, z * frequency, repeat) * amplitude
+        max_amplitude += amplitude
+        frequency *= LACUNARITY
+        amplitude *= PERSISTENCE
+        if octave in octaves:
+            output[octave] = (total / max_amplitude).astype(np.float64)
+    return output
+
+
+def pnoise3(points: np.ndarray, octaves: int = 1) -> np.ndarray:
+    """Векторизованный noise.pnoise3 для массива точек (N, 3)"""
+    return pnoise3_octaves(points, [octaves])[octaves]
+
+
+def layered_pnoise3(
+    points: np.ndarray,
+    octaves: list[int],
+    coefficients: list[float],
+    octave_noise: dict[int, np.ndarray] | None = None,
+) -> np.ndarray:
+    """Сумма k * pnoise3(points, octave) по парам octave, k.
+
+    Args:
+        points: Массив (N, 3) декартовых координат.
+        octaves: Числа октав слоёв.
+        coefficients: Коэффициенты слоёв.
+        octave_noise: Кэш результатов pnoise3_octaves для этих же точек.
+            Недостающие октавы досчитываются и добавляются в него.
+
+    Returns:
+        Массив (N,) значений шума.
+    """
+    if octave_noise is None:
+        octave_noise = {}
+    missing_octaves = set(octaves) - octave_noise.keys()
+    if missing_octaves:
+        octave_noise.update(pnoise3_octaves(points, missing_octaves))
+
+    noise_map = np.zeros(len(points), dtype=np.float64)
+    for octave, k in zip(octaves, coefficients):
+        noise_map += k * octave_noise[octave]
+    return noise_map
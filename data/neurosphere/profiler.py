@@ -0,0 +1,115 @@
+"""Профилирование стадий генерации мира.
+
+Для каждой стадии и подстадии записываются время, процессорное время
+и число точек, а если включено TRACE_MEMORY - ещё и пиковая память. Отчёт - дерево словарей, которое
+сохраняется в данных мира и выгружается в JSON.
+"""
+
+import json
+import logging
+import time
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+# tracemalloc замедляет генерацию примерно на четверть и следит за всеми
+# выделениями памяти процесса, в том числе бота, поэтому включается только
+# для замеров, например в benchmark_generation.py
+TRACE_MEMORY = False
+
+
+class GenerationProfiler:
+    """Записывает отчёт о стадиях генерации.
+
+    Стадии вкладываются друг в друга через with profiler.stage(...).
+    Процессорное время и память считаются только для текущего процесса:
+    работа в пуле процессов видна как время ожидания результата.
+
+    Args:
+        points_number: Число точек генерируемого мира.
+        trace_memory: Записывать ли пиковую память, по умолчанию TRACE_MEMORY.
+            Без этого peak_memory в записях стадий - None.
+    """
+
+    def __init__(self, points_number: int, trace_memory: bool | None = None):
+        self.points_number = points_number
+        self.trace_memory = TRACE_MEMORY if trace_memory is None else trace_memory
+        self.report: dict | None = None  # запись первой, внешней стадии
+        self._stack: list[list] = []  # открытые стадии: [запись, память, пик]
+        self._started_tracing = False
+
+    def _new_record(self, name: str) -> dict:
+        return {
+            "name": name,
+            "wall_time": 0.0,  # секунд
+            "cpu_time": 0.0,  # секунд
+            # байт сверх памяти в начале стадии или None, если память не считается
+            "peak_memory": 0 if self.trace_memory else None,
+            "points": self.points_number,
+            "stages": [],
+        }
+
+    @contextmanager
+    def stage(self, name: str, **info) -> Iterator[dict]:
+        """Записывает стадию name. info добавляется в запись стадии как есть"""
+        record = self._new_record(name)
+        if self._stack:
+            self._stack[-1][0]["stages"].append(record)
+        else:
+            self.report = record
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+        record.update(info)
+
+        self._update_peaks()
+        start_memory = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        frame = [record, start_memory, start_memory]
+        self._stack.append(frame)
+        start_wall_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_time"] = time.perf_counter() - start_wall_time
+            record["cpu_time"] = time.process_time() - start_cpu_time
+            self._update_peaks()
+            self._stack.pop()
+            if self.trace_memory:
+                record["peak_memory"] = frame[2] - frame[1]
+
+            if not self._stack and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+            logging.info(f"Стадия {name}: {record['wall_time']:.2f}с")
+
+    def _update_peaks(self) -> None:
+        """Переносит пик памяти с прошлого вызова во все открытые стадии"""
+        if not self.trace_memory or not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in self._stack:
+            frame[2] = max(frame[2], peak)
+        tracemalloc.reset_peak()
+
+
+def report_to_json(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, indent=2)
+
+
+def format_report(record: dict, depth: int = 0) -> str:
+    """Отчёт в виде дерева строк: время, процессорное время и пиковая память,
+    если она считалась"""
+    cached = " (кэш)" if record.get("cached") else ""
+    line = (
+        f"{'  ' * depth}{record['name']}{cached}: {record['wall_time']:.3f}с, "
+        f"CPU {record['cpu_time']:.3f}с"
+    )
+    if record["peak_memory"] is not None:
+        line += f", {record['peak_memory'] / 1024**2:.1f} МБ"
+    if depth == 0:
+        line += f", {record['points']} точек"
+    lines = [line]
+    for stage in record["stages"]:
+        lines.append(format_report(stage, depth + 1))
+    return "\n".join(lines)
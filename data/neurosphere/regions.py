@@ -0,0 +1,229 @@
+"""Разбиение точек планеты на области.
+
+Точки планеты - спираль Фибоначчи: точку с данным id можно посчитать,
+не генерируя остальные, а точки одного пояса широт идут подряд по id.
+Сфера делится на пояса широт, а пояса - на сектора долгот примерно
+одинаковой площади. Так мозаичная планета генерирует, кэширует и
+выгружает области по отдельности.
+"""
+
+import os
+
+import numpy as np
+
+REGION_POINTS = 4096  # примерное число точек в области
+GOLDEN_FRACTION = (5**0.5 - 1) / 2  # дробная часть золотого сечения
+
+
+def fibonacci_points(
+    point_ids: np.ndarray, points_number: int, legacy: bool = False
+) -> np.ndarray:
+    """Широты и долготы (M, 2) точек point_ids спирали Фибоначчи из points_number точек.
+
+    Считает так же, как если бы генерировались все точки сразу,
+    поэтому точки совпадают до последнего бита.
+
+    Args:
+        legacy: Считать во float32, как до GENERATOR_VERSION 6. На больших
+            планетах так теряется почти вся точность долготы, но этими точками
+            заняты id локаций мозаичных планет из старых сохранений.
+    """
+    if legacy:
+        indices = np.asarray(point_ids).astype(np.float32) + 0.5
+        # int Python, а не numpy: иначе деление посчитается во float64
+        phi = np.arccos(1 - 2 * indices / int(points_number))
+        theta = (np.pi * (1 + 5**0.5)) * indices
+        return np.column_stack((np.pi / 2 - phi, theta % (2 * np.pi))).astype(np.float64)
+
+    point_ids = np.asarray(point_ids, dtype=np.float64)
+    latitude = np.arcsin(1 - 2 * (point_ids + 0.5) / points_number)
+    # долгота - золотой угол 2pi * (1 + GOLDEN_FRACTION), умноженный на id + 0.5,
+    # по модулю 2pi. Целые обороты отбрасываются до умножения на 2pi,
+    # поэтому угол не теряет точность даже на миллиардах точек
+    turns = point_ids * GOLDEN_FRACTION + (1 + GOLDEN_FRACTION) / 2
+    longitude = 2 * np.pi * np.mod(turns, 1)
+    return np.column_stack((latitude, longitude))
+
+
+class RegionGrid:
+    """Области спирали Фибоначчи: пояса широт одинаковой высоты,
+    поделённые на сектора долгот примерно той же ширины.
+
+    Пояса нумеруются с севера, id области - номер сектора
+    плюс число секторов в поясах севернее."""
+
+    def __init__(
+        self, points_number: int, region_points: int = REGION_POINTS, legacy: bool = False
+    ):
+        self.points_number = points_number
+        self.legacy = legacy  # точки считаются как fibonacci_points(..., legacy=True)
+        side = np.sqrt(4 * np.pi * region_points / points_number)  # в радианах
+        bands_number = max(1, round(np.pi / side))
+        self._band_height = np.pi / bands_number
+        band_middles = np.pi / 2 - (np.arange(bands_number) + 0.5) * self._band_height
+        self._sectors_numbers = np.maximum(
+            1, np.round(2 * np.pi * np.cos(band_middles) / self._band_height)
+        ).astype(np.int64)
+        self._band_offsets = np.zeros(bands_number + 1, dtype=np.int64)
+        np.cumsum(self._sectors_numbers, out=self._band_offsets[1:])
+
+    def __len__(self) -> int:
+        return int(self._band_offsets[-1])
+
+    def get_points(self, point_ids) -> np.ndarray:
+        """Широты и долготы (M, 2) точек point_ids"""
+        return fibonacci_points(point_ids, self.points_number, self.legacy)
+
+    def _get_bands(self, latitudes) -> np.ndarray:
+        bands = np.floor((np.pi / 2 - np.asarray(latitudes)) / self._band_height)
+        return np.clip(bands, 0, len(self._sectors_numbers) - 1).astype(np.int64)
+
+    def get_regions(self, points: np.ndarray) -> np.ndarray:
+        """id областей точек (M, 2)"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        bands = self._get_bands(points[:, 0])
+        sectors_numbers = self._sectors_numbers[bands]
+        sectors = np.floor(points[:, 1] / (2 * np.pi) * sectors_numbers).astype(np.int64)
+        sectors = np.clip(sectors, 0, sectors_numbers - 1)
+        return self._band_offsets[bands] + sectors
+
+    def _get_bounds(self, region: int) -> tuple[float, float, float, float]:
+        """Границы области: наименьшая и наибольшая широта и долгота"""
+        band = int(np.searchsorted(self._band_offsets, region, side="right")) - 1
+        sector = region - self._band_offsets[band]
+        sector_width = 2 * np.pi / self._sectors_numbers[band]
+        max_latitude = np.pi / 2 - band * self._band_height
+        return (
+            max_latitude - self._band_height,
+            max_latitude,
+            sector * sector_width,
+            (sector + 1) * sector_width,
+        )
+
+    def get_point_ids(self, region: int, margin: float = 0) -> np.ndarray:
+        """id точек области и, если margin больше нуля, точек не дальше margin
+        (в радианах) от неё - и, возможно, немного дальше. По возрастанию id."""
+        point_ids, points = self._get_points_near(*self._get_bounds(region), margin)
+        if margin > 0:
+            return point_ids
+        return point_ids[self.get_regions(points) == region]
+
+    def get_point_ids_near(self, latitude: float, longitude: float, distance: float):
+        """id и координаты точек не дальше distance (в радианах) от точки,
+        а возможно, и немного дальше"""
+        return self._get_points_near(latitude, latitude, longitude, longitude, distance)
+
+    def _get_points_near(
+        self,
+        min_latitude: float,
+        max_latitude: float,
+        min_longitude: float,
+        max_longitude: float,
+        margin: float,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # точки пояса широт идут подряд: z = sin(широты) = 1 - 2 * (id + 0.5) / n
+        n = self.points_number
+        top = np.sin(min(max_latitude + margin, np.pi / 2))
+        bottom = np.sin(max(min_latitude - margin, -np.pi / 2))
+        # запас в пару точек на погрешность округления в fibonacci_points
+        first = max(int(np.floor((1 - top) * n / 2 - 0.5)) - 2, 0)
+        last = min(int(np.ceil((1 - bottom) * n / 2 - 0.5)) + 2, n - 1)
+        point_ids = np.arange(first, last + 1)
+        points = self.get_points(point_ids)
+
+        latitudes, longitudes = points.T
+        near = (latitudes >= min_latitude - margin) & (latitudes <= max_latitude + margin)
+        longitude_width = max_longitude - min_longitude
+        if longitude_width < 2 * np.pi:
+            # разница долгот с ближайшей долготой отрезка [min_longitude, max_longitude]
+            delta = np.minimum(
+                (min_longitude - longitudes) % (2 * np.pi),
+                (longitudes - max_longitude) % (2 * np.pi),
+            )
+            delta[(longitudes - min_longitude) % (2 * np.pi) <= longitude_width] = 0
+            # расстояние до меридиана не меньше arcsin(cos(широты) * sin(разницы долгот))
+            near &= np.cos(latitudes) * np.sin(np.minimum(delta, np.pi / 2)) <= np.sin(
+                margin
+            )
+        return point_ids[near], points[near]
+
+    def get_regions_near(self, latitude: float, longitude: float, distance: float):
+        """id областей, в которых могут быть точки не дальше distance (в радианах)
+        от точки"""
+        first_band, last_band = self._get_bands(
+            [min(latitude + distance, np.pi / 2), max(latitude - distance, -np.pi / 2)]
+        )
+        regions = []
+        for band in range(first_band, last_band + 1):
+            sectors_number = int(self._sectors_numbers[band])
+            # наибольшая по модулю широта, на которой могут быть точки
+            max_latitude = np.pi / 2 - band * self._band_height
+            edge_latitude = max(
+                abs(min(max_latitude, latitude + distance)),
+                abs(max(max_latitude - self._band_height, latitude - distance)),
+            )
+            ratio = np.sin(distance) / max(np.cos(edge_latitude), 1e-12)
+            if ratio >= 1:
+                sectors = range(sectors_number)
+            else:
+                half_width = np.arcsin(ratio)
+                sector_width = 2 * np.pi / sectors_number
+                first = int(np.floor((longitude - half_width) / sector_width))
+                last = int(np.floor((longitude + half_width) / sector_width))
+                sectors = {
+                    sector % sectors_number
+                    for sector in range(first, min(last, first + sectors_number - 1) + 1)
+                }
+            regions.extend(int(self._band_offsets[band]) + sector for sector in sectors)
+        return sorted(regions)
+
+
+class Region:
+    """Сгенерированная область планеты.
+
+    Массивы выровнены по point_ids - id точек области по возрастанию,
+    кроме графа соседей в формате CSR: соседи точки с номером i в области -
+    neighbor_point_ids[neighbor_offsets[i]:neighbor_offsets[i + 1]],
+    это id точек всей планеты.
+    """
+
+    ARRAYS = (
+        "point_ids",
+        "points",
+        "tectonic_map",
+        "height_map",
+        "heat_map",
+        "precipitation_map",
+        "biome_map",
+        "neighbor_offsets",
+        "neighbor_point_ids",
+    )
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.point_ids = arrays["point_ids"]
+
+    def __len__(self) -> int:
+        return len(self.point_ids)
+
+    def index(self, point_id: int) -> int:
+        """Номер точки в массивах области"""
+        index = int(np.searchsorted(self.point_ids, point_id))
+        if index == len(self.point_ids) or self.point_ids[index] != point_id:
+            raise KeyError(point_id)
+        return index
+
+    def get_neighbor_point_ids(self, point_id: int) -> np.ndarray:
+        index = self.index(point_id)
+        start, end = self.arrays["neighbor_offsets"][index : index + 2]
+        return self.arrays["neighbor_point_ids"][start:end]
+
+    def write(self, directory: str) -> None:
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), self.arrays[name])
+
+    @classmethod
+    def read(cls, directory: str) -> "Region":
+        return cls(
+            {name: np.load(os.path.join(directory, f"{name}.npy")) for name in cls.ARRAYS}
+        )
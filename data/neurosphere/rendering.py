@@ -0,0 +1,155 @@
+"""Растровые карты миров.
+
+Карта - равнопромежуточная проекция: каждый пиксель красится цветом ближайшей
+к его центру точки мира. Вид на глобус - ортографическая проекция полушария,
+повёрнутого к камере, так же по ближайшим точкам. Ближайшие точки ищутся
+сразу для всех пикселей через SphereIndex, цвета слоёв считаются массивами
+по всем точкам.
+"""
+
+import colorsys
+
+import numpy as np
+from matplotlib import image
+
+from data.neurosphere.spatial import SphereIndex
+
+MAP_WIDTH = 1024  # пикселей, высота вдвое меньше
+MAP_FILE_NAME = "map.png"
+GLOBE_SIZE = 768  # пикселей, сторона квадратного вида на глобус
+GLOBE_SHADING = 0.4  # насколько темнее края глобуса, чем его центр
+LAYERS = ("biome", "height", "heat", "precipitation")
+# увеличивать при изменении вида карт, иначе кэш отдаст старые картинки
+RENDERER_VERSION = 1
+
+# биом -> (тон 0-360, насыщенность 0-100, яркость 0-100)
+BIOME_HSV = {
+    "marine": (210, 90, 70),
+    "desert": (45, 85, 90),
+    "savanna": (65, 85, 80),
+    "polar": (190, 0, 100),
+    "tundra": (200, 50, 85),
+    "taiga": (150, 70, 60),
+    "plains": (85, 75, 75),
+    "seasonal_forest": (100, 80, 70),
+    "temperate_rainforest": (120, 90, 80),
+    "swamp": (100, 60, 60),
+    "steppe": (70, 65, 80),
+    "tropical_desert": (37, 80, 90),
+    "tropical_seasonal_forest": (110, 85, 75),
+    "tropical_rainforest": (140, 95, 60),
+    "glacier": (190, 15, 85),
+    "mountain": (0, 0, 75),
+    "snowy_mountain": (0, 0, 95),
+}
+# градиенты: (доля от нижней до верхней границы слоя, цвет)
+WATER_GRADIENT = [(0, (10, 25, 80)), (1, (70, 140, 220))]
+LAND_GRADIENT = [
+    (0, (90, 160, 80)),
+    (0.5, (190, 170, 100)),
+    (0.8, (130, 110, 90)),
+    (1, (245, 245, 245)),
+]
+HEAT_GRADIENT = [
+    (0, (40, 50, 170)),
+    (0.4, (150, 200, 240)),
+    (0.6, (240, 230, 140)),
+    (1, (190, 30, 30)),
+]
+PRECIPITATION_GRADIENT = [(0, (235, 215, 160)), (0.5, (80, 170, 90)), (1, (30, 60, 170))]
+
+
+def biome_palette(biomes: list[str]) -> np.ndarray:
+    """Цвета (len(biomes), 3) от 0 до 1, выровненные по biomes"""
+    return np.array(
+        [
+            colorsys.hsv_to_rgb(hue / 360, saturation / 100, value / 100)
+            for hue, saturation, value in (BIOME_HSV[biome] for biome in biomes)
+        ]
+    )
+
+
+def apply_gradient(values: np.ndarray, min: float, max: float, gradient) -> np.ndarray:
+    """Цвета (N, 3) uint8 значений по градиенту, растянутому от min до max"""
+    positions = np.array([position for position, _ in gradient]) * (max - min) + min
+    colors = np.array([color for _, color in gradient], dtype=np.float64)
+    return np.column_stack(
+        [np.interp(values, positions, colors[:, channel]) for channel in range(3)]
+    ).astype(np.uint8)
+
+
+def pixel_points(width: int) -> np.ndarray:
+    """Широты и долготы (width // 2 * width, 2) центров пикселей карты
+    построчно с севера, долгота от 0 до 2pi слева направо"""
+    height = width // 2
+    latitudes = np.pi / 2 - (np.arange(height) + 0.5) * np.pi / height
+    longitudes = (np.arange(width) + 0.5) * 2 * np.pi / width
+    return np.column_stack((np.repeat(latitudes, width), np.tile(longitudes, height)))
+
+
+def nearest_point_indices(index: SphereIndex, width: int) -> np.ndarray:
+    """Номера (width // 2, width) ближайших к пикселям точек индекса"""
+    _, indices = index.nearest(pixel_points(width))
+    return indices.reshape(width // 2, width)
+
+
+def render_globe(
+    index: SphereIndex,
+    colors: np.ndarray,
+    latitude: float,
+    longitude: float,
+    size: int = GLOBE_SIZE,
+) -> np.ndarray:
+    """Вид на глобус из камеры над точкой (latitude, longitude) в радианах.
+
+    Args:
+        index: Индекс точек мира.
+        colors: Цвета (N, 3) uint8, выровненные по точкам индекса.
+        size: Сторона картинки в пикселях.
+
+    Returns:
+        Картинка (size, size, 4) uint8, вне глобуса прозрачная.
+    """
+    # базис камеры: направление на камеру, восток и север в центре вида
+    camera = np.array(
+        [
+            np.cos(latitude) * np.cos(longitude),
+            np.cos(latitude) * np.sin(longitude),
+            np.sin(latitude),
+        ]
+    )
+    east = np.array([-np.sin(longitude), np.cos(longitude), 0])
+    north = np.cross(camera, east)
+
+    # координаты центров пикселей от -1 до 1, y вверх
+    coordinates = (np.arange(size) + 0.5) / size * 2 - 1
+    x, y = np.meshgrid(coordinates, -coordinates)
+    inside = x**2 + y**2 <= 1
+    x, y = x[inside], y[inside]
+    depth = np.sqrt(1 - x**2 - y**2)
+    vectors = np.outer(x, east) + np.outer(y, north) + np.outer(depth, camera)
+    _, indices = index.nearest(
+        np.column_stack(
+            (
+                np.arcsin(np.clip(vectors[:, 2], -1, 1)),
+                np.arctan2(vectors[:, 1], vectors[:, 0]) % (2 * np.pi),
+            )
+        )
+    )
+
+    globe = np.zeros((size, size, 4), dtype=np.uint8)
+    shading = 1 - GLOBE_SHADING * (1 - depth)
+    globe[inside, :3] = (colors[indices] * shading[:, None]).astype(np.uint8)
+    globe[inside, 3] = 255
+    return globe
+
+
+def write_image(path: str, image_array: np.ndarray) -> None:
+    """Сохраняет картинку (H, W, 3 или 4) uint8 в PNG"""
+    # слабое сжатие в разы быстрее, а файл больше всего на несколько процентов
+    image.imsave(path, image_array, format="png", pil_kwargs={"compress_level": 1})
+
+
+def write_png(path: str, colors: np.ndarray, indices: np.ndarray) -> None:
+    """Сохраняет карту: пиксели с номерами точек indices и цвета точек colors"""
+    write_image(path, colors[indices])
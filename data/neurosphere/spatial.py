@@ -0,0 +1,93 @@
+"""Пространственный индекс точек на единичной сфере.
+
+Точки хранятся как единичные векторы в KD-дереве с евклидовой метрикой.
+Расстояние по хорде монотонно зависит от углового, поэтому ближайшие точки
+те же, что и по гаверсинусу, но считаются гораздо дешевле.
+Все расстояния на входе и выходе - углы в радианах.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def angle_to_chord(angle):
+    """Длина хорды единичной сферы, стягивающей дугу angle"""
+    return 2 * np.sin(np.minimum(angle, np.pi) / 2)
+
+
+def chord_to_angle(chord):
+    """Угловая длина дуги, которую стягивает хорда единичной сферы"""
+    return 2 * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def to_unit_vectors(points: np.ndarray) -> np.ndarray:
+    """Массив (N, 2) широт и долгот в массив (N, 3) единичных векторов"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    lat, lon = points[:, 0], points[:, 1]
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+class SphereIndex:
+    """KD-дерево по единичным векторам точек сферы.
+
+    Запросы принимают массивы (M, 2) широт и долгот и обрабатывают все точки сразу.
+    """
+
+    def __init__(self, points: np.ndarray):
+        self._tree = cKDTree(to_unit_vectors(points))
+
+    def __len__(self) -> int:
+        return self._tree.n
+
+    def nearest(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Ближайшая точка индекса для каждой точки.
+
+        Returns:
+            Массивы (M,) угловых расстояний и индексов.
+        """
+        chords, indices = self._tree.query(to_unit_vectors(points), k=1, workers=-1)
+        return chord_to_angle(chords), indices
+
+    def k_nearest(self, points: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """k ближайших точек индекса для каждой точки, от ближней к дальней.
+
+        Returns:
+            Массивы (M, k) угловых расстояний и индексов.
+        """
+        chords, indices = self._tree.query(
+            to_unit_vectors(points), k=[*range(1, k + 1)], workers=-1
+        )
+        return chord_to_angle(chords), indices
+
+    def _query_ball_point(self, points: np.ndarray, radius: float) -> np.ndarray:
+        return self._tree.query_ball_point(
+            to_unit_vectors(points),
+            angle_to_chord(radius),
+            workers=-1,
+            return_sorted=True,
+        )
+
+    def within_radius(self, points: np.ndarray, radius: float) -> list[np.ndarray]:
+        """Индексы точек индекса не дальше radius (в радианах) от каждой точки,
+        по возрастанию индекса"""
+        return [
+            np.array(point_ids, dtype=np.intp)
+            for point_ids in self._query_ball_point(points, radius)
+        ]
+
+    def within_radius_pairs(
+        self, points: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """То же, что within_radius, но плоскими массивами пар.
+
+        Returns:
+            Массивы номеров точек запроса и индексов точек индекса одинаковой длины,
+            упорядоченные по номеру точки запроса.
+        """
+        # ответ без списков Python: на миллионах пар они дороже самого поиска
+        pairs = cKDTree(to_unit_vectors(points)).sparse_distance_matrix(
+            self._tree, angle_to_chord(radius), output_type="ndarray"
+        )
+        order = np.lexsort((pairs["j"], pairs["i"]))
+        return pairs["i"][order], pairs["j"][order]
@@ -0,0 +1,140 @@
+"""Стадии генерации мира и их параллельное выполнение.
+
+Генерация - граф стадий: каждая стадия объявляет, результаты каких стадий
+и какие параметры генерации она читает. По ним считается ключ стадии,
+поэтому после изменения параметров пересчитываются только стадии,
+чьи ключи изменились.
+
+Стадии, которые не зависят друг от друга, отправляются в пул процессов,
+а поточечные вычисления (шум) делятся на части по точкам.
+Результат не зависит от того, в каком порядке и где выполнились стадии:
+стадии не трогают глобальный random, а случайные числа берут
+из своего генератора stage_rng.
+"""
+
+import hashlib
+import multiprocessing
+import os
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Self
+
+import numpy as np
+
+MAX_WORKERS = os.cpu_count() or 1
+# на маленьких планетах запуск процессов дольше самой генерации
+MIN_PARALLEL_POINTS = 100_000
+# fork копирует процесс бота вместе с чужими потоками и их захваченными
+# блокировками, и процесс пула может зависнуть, поэтому процессы пула
+# запускаются с нуля (forkserver есть не везде, spawn - везде)
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def stage_seed(seed: int, stage: str) -> int:
+    """Сид стадии - зависит только от сида мира и названия стадии"""
+    digest = hashlib.sha256(f"{seed}:{stage}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def stage_rng(seed: int, stage: str) -> np.random.Generator:
+    """Генератор случайных чисел стадии - не зависит от того,
+    какие стадии и в каком порядке выполнялись до неё"""
+    return np.random.default_rng(stage_seed(seed, stage))
+
+
+class Stage:
+    """Стадия генерации.
+
+    Args:
+        name: Название стадии.
+        inputs: Стадии, результаты которых она читает.
+        parameters: Ключи data["generation"], которые она читает.
+        outputs: Массивы, которые она создаёт (атрибуты мира без "_" в начале).
+        generated: Ключи data["generation"], которые она вычисляет.
+        cached: Сохранять ли результаты в кэш генерации.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        inputs: tuple[str, ...],
+        parameters: tuple[str, ...],
+        outputs: tuple[str, ...],
+        generated: tuple[str, ...] = (),
+        cached: bool = True,
+    ):
+        self.name = name
+        self.inputs = inputs
+        self.parameters = parameters
+        self.outputs = outputs
+        self.generated = generated
+        self.cached = cached
+
+    def __repr__(self) -> str:
+        return f"Stage({self.name!r})"
+
+
+def stage_levels(stages: list[Stage]) -> list[list[Stage]]:
+    """Разбивает стадии на уровни: стадии уровня зависят только от прошлых уровней,
+    поэтому стадии одного уровня можно выполнять одновременно"""
+    levels = []
+    done = set()
+    remaining = list(stages)
+    while remaining:
+        level = [stage for stage in remaining if done.issuperset(stage.inputs)]
+        if not level:
+            names = [stage.name for stage in remaining]
+            raise ValueError(f"Stages have missing or cyclic inputs: {names}")
+        levels.append(level)
+        done.update(stage.name for stage in level)
+        remaining = [stage for stage in remaining if stage not in level]
+    return levels
+
+
+class StagePool:
+    """Пул процессов для стадий генерации.
+
+    Если точек мало или доступно одно ядро, стадии выполняются сразу
+    в текущем процессе, а submit возвращает уже готовый Future.
+    """
+
+    def __init__(self, points_number: int, max_workers: int = MAX_WORKERS):
+        self.workers = max_workers if points_number >= MIN_PARALLEL_POINTS else 1
+        self._executor: ProcessPoolExecutor | None = None
+
+    def __enter__(self) -> Self:
+        if self.workers > 1:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(START_METHOD),
+            )
+        return self
+
+    def __exit__(self, *_) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def submit(self, function: Callable, *args) -> Future:
+        """Запускает function(*args). function и аргументы должны сериализоваться pickle"""
+        if self._executor is not None:
+            return self._executor.submit(function, *args)
+
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as exception:  # noqa
+            future.set_exception(exception)
+        return future
+
+    def map_points(self, function: Callable, points: np.ndarray, *args) -> list:
+        """Вызывает function(часть points, *args) для частей массива по числу процессов.
+
+        Returns:
+            Результаты для частей по порядку точек.
+        """
+        chunks = np.array_split(points, self.workers) if self.workers > 1 else [points]
+        futures = [self.submit(function, chunk, *args) for chunk in chunks]
+        return [future.result() for future in futures]
@@ -0,0 +1,104 @@
+"""Статистика сгенерированного мира для настройки генерации.
+
+Всё считается массивами по всем точкам сразу. Точки спирали Фибоначчи
+делят сферу на равные по площади части, поэтому доля точек - это доля площади.
+Гистограммы строятся по диапазонам из параметров генерации, так что
+гистограммы разных миров с одними диапазонами можно сравнивать.
+"""
+
+import numpy as np
+
+HISTOGRAM_BINS = 20
+
+
+def histogram(values: np.ndarray, low: float, high: float, bins: int) -> dict:
+    """Гистограмма values на bins равных отрезков от low до high.
+    Значения за границами попадают в крайние отрезки."""
+    counts, edges = np.histogram(np.clip(values, low, high), bins=bins, range=(low, high))
+    return {
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+        "edges": edges.tolist(),
+        "counts": counts.tolist(),
+    }
+
+
+def compute_statistics(
+    layers: dict[str, np.ndarray],
+    biomes: list[str],
+    generation: dict,
+    bins: int = HISTOGRAM_BINS,
+) -> dict:
+    """Статистика мира.
+
+    Args:
+        layers: Непустые tectonic_map, height_map, heat_map, precipitation_map
+            и biome_map, выровненные по точкам, вещественные слои - в значениях.
+        biomes: biome_id -> биом.
+        generation: Параметры генерации мира с уровнями воды и гор.
+        bins: Отрезков в гистограммах.
+    """
+    points_number = len(layers["height_map"])
+    water_level = generation["water_level"]
+    height_map = layers["height_map"]
+    heat_map = layers["heat_map"]
+    land = height_map >= water_level  # как в карте биомов
+    biome_counts = np.bincount(layers["biome_map"], minlength=len(biomes))
+    plate_counts = np.bincount(layers["tectonic_map"])
+
+    height = generation["height"]
+    temperature = generation["temperature"]
+    precipitation = generation["precipitation"]
+    return {
+        "points": points_number,
+        "land_share": float(land.mean()),
+        "mountain_share": float((height_map > generation["mountain_height"]).mean()),
+        "biome_shares": {
+            biome: float(count / points_number)
+            for biome, count in zip(biomes, biome_counts, strict=True)
+            if count
+        },
+        "plates": int(np.count_nonzero(plate_counts)),
+        "plate_shares": (plate_counts / points_number).tolist(),
+        "mean_land_heat": float(heat_map[land].mean()) if land.any() else None,
+        "histograms": {
+            "height": histogram(
+                height_map, height["min_height"], height["max_height"], bins
+            ),
+            "heat": histogram(
+                heat_map, temperature["min_temp"], temperature["max_temp"], bins
+            ),
+            "precipitation": histogram(
+                layers["precipitation_map"],
+                precipitation["min_precipitation"],
+                precipitation["max_precipitation"],
+                bins,
+            ),
+        },
+    }
+
+
+def format_statistics(statistics: dict) -> str:
+    """Статистика строками: доли площади, плиты, средние и гистограммы"""
+    lines = [
+        f"Точек: {statistics['points']}",
+        f"Суша: {statistics['land_share']:.1%}, горы: {statistics['mountain_share']:.1%}",
+        f"Тектонических плит: {statistics['plates']}",
+    ]
+    if statistics["mean_land_heat"] is not None:
+        lines.append(f"Средняя температура на суше: {statistics['mean_land_heat']:.1f}")
+    lines.append("Биомы:")
+    for biome, share in sorted(
+        statistics["biome_shares"].items(), key=lambda item: item[1], reverse=True
+    ):
+        lines.append(f"  {biome}: {share:.1%}")
+    for name, record in statistics["histograms"].items():
+        lines.append(
+            f"{name}: от {record['min']:.1f} до {record['max']:.1f}, "
+            f"в среднем {record['mean']:.1f}"
+        )
+        peak = max(record["counts"]) or 1
+        for low, count in zip(record["edges"], record["counts"], strict=False):
+            lines.append(f"  {low:8.1f} {'#' * round(20 * count / peak)} {count}")
+    return "\n".join(lines)
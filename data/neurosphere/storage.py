@@ -0,0 +1,85 @@
+"""Точность хранения слоёв мира в памяти и в сохранениях.
+
+float64 и float32 хранят значения как есть. int16 - фиксированная точка:
+значение = offset + code * step, где offset и step подбираются по диапазону
+слоя и хранятся вместе с ним, так что ошибка не больше step / 2.
+uint8 - для целочисленных слоёв вроде биомов и тектонических плит; если
+значения в него не влезают (например, плит больше 256), берётся наименьший
+целый тип, в который они влезают.
+"""
+
+import numpy as np
+
+STORAGE_DTYPES = {
+    "float64": np.float64,
+    "float32": np.float32,
+    "int16": np.int16,
+    "uint8": np.uint8,
+}
+
+
+def encode(values: np.ndarray, storage: str) -> tuple[np.ndarray, list[float] | None]:
+    """Переводит слой в тип storage из STORAGE_DTYPES.
+
+    Returns:
+        Массив типа storage (у целого слоя, не влезшего в storage, - наименьшего
+        подходящего целого типа) и [offset, step], если вещественный слой
+        хранится с фиксированной точкой, иначе None.
+    """
+    if storage not in STORAGE_DTYPES:
+        raise ValueError(f"Unknown storage type: {storage}")
+    dtype = np.dtype(STORAGE_DTYPES[storage])
+    values = np.asarray(values)
+    if dtype.kind == "f":
+        return values.astype(dtype), None
+
+    info = np.iinfo(dtype)
+    if values.dtype.kind in "iu":
+        if values.size and (values.min() < info.min or values.max() > info.max):
+            dtype = np.promote_types(
+                np.min_scalar_type(values.min()), np.min_scalar_type(values.max())
+            )
+        return values.astype(dtype), None
+
+    if dtype != np.int16:
+        raise ValueError(f"{storage} is only for integer layers")
+    low = float(values.min()) if values.size else 0.0
+    high = float(values.max()) if values.size else 0.0
+    step = (high - low) / (int(info.max) - int(info.min)) or 1.0
+    offset = low - int(info.min) * step  # код info.min - минимум слоя
+    codes = np.round((values - offset) / step)
+    return np.clip(codes, info.min, info.max).astype(dtype), [offset, step]
+
+
+def decode(array: np.ndarray, scale: list[float] | None) -> np.ndarray:
+    """Значения слоя, сохранённого encode со шкалой scale"""
+    if scale is None:
+        return array
+    offset, step = scale
+    return array * step + offset
+
+
+def quantization_error(
+    values: np.ndarray, array: np.ndarray, scale: list[float] | None
+) -> dict:
+    """Ошибка хранения values в array и сколько памяти это сэкономило"""
+    error = np.abs(decode(array, scale).astype(np.float64) - values)
+    return {
+        "storage": array.dtype.name,
+        "max_error": float(error.max()) if error.size else 0.0,
+        "mean_error": float(error.mean()) if error.size else 0.0,
+        "bytes": int(array.nbytes),
+        "source_bytes": int(np.asarray(values).nbytes),
+    }
+
+
+def format_storage_report(report: dict[str, dict]) -> str:
+    """Отчёт по строке на слой: тип, ошибка и размер"""
+    lines = []
+    for name, record in report.items():
+        lines.append(
+            f"{name}: {record['storage']}, ошибка до {record['max_error']:.4g} "
+            f"(в среднем {record['mean_error']:.4g}), "
+            f"{record['source_bytes'] / 1024**2:.1f} -> {record['bytes'] / 1024**2:.1f} МБ"
+        )
+    return "\n".join(lines)
@@ -1,18 +1,58 @@
-import colorsys
+import copy
+import hashlib
+import json
 import logging
+import os
 import random
-import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from typing import TYPE_CHECKING
 
-import noise
 import numpy as np
-from sklearn.neighbors import BallTree
 
 if TYPE_CHECKING:
     from cogwheels.neurosphere import Neurosphere
 
 
-from data.neurosphere.objects import Character, Item, Location, World, new_id
+from data.neurosphere.biome_index import BiomeIndex
+from data.neurosphere.generation_cache import GenerationCache
+from data.neurosphere.objects import (
+    Character,
+    Item,
+    Location,
+    LocationHolder,
+    ProgressCallback,
+    World,
+    new_id,
+)
+from data.neurosphere.pathfinding import PathFinder
+from data.neurosphere.perlin import layered_pnoise3, pnoise3_octaves
+from data.neurosphere.profiler import GenerationProfiler
+from data.neurosphere.regions import Region, RegionGrid, fibonacci_points
+from data.neurosphere.rendering import (
+    HEAT_GRADIENT,
+    LAND_GRADIENT,
+    LAYERS,
+    MAP_FILE_NAME,
+    MAP_WIDTH,
+    PRECIPITATION_GRADIENT,
+    RENDERER_VERSION,
+    WATER_GRADIENT,
+    apply_gradient,
+    biome_palette,
+    nearest_point_indices,
+    write_png,
+)
+from data.neurosphere.spatial import SphereIndex, to_unit_vectors
+from data.neurosphere.stages import Stage, StagePool, stage_levels, stage_rng
+from data.neurosphere.statistics import compute_statistics
+from data.neurosphere.storage import (
+    STORAGE_DTYPES,
+    decode,
+    encode,
+    format_storage_report,
+    quantization_error,
+)
 
 BIOME_NAMES = {
     "marine": "Marine",
@@ -33,6 +73,102 @@ BIOME_NAMES = {
     "mountain": "Mountain",
     "snowy_mountain": "Snowy Mountain",
 }
+# во сколько раз дороже пройти единицу расстояния по биому, остальные биомы - 1
+BIOME_TRAVEL_COSTS = {
+    "marine": 5,
+    "glacier": 2,
+    "swamp": 2,
+    "mountain": 3,
+    "snowy_mountain": 4,
+}
+# добавка к стоимости единицы расстояния за подъём от уровня воды до гор
+CLIMB_TRAVEL_COST = 20
+# увеличивать при любом изменении результата генерации, иначе кэш отдаст старые планеты
+GENERATOR_VERSION = 6
+GENERATION_CACHE = GenerationCache()
+COARSE_RADIUS = 50  # радиус грубой планеты, по которой считается мозаичная планета
+MAX_LOADED_REGIONS = 64  # областей мозаичной планеты в памяти
+REGION_LOAD_DISTANCE = 16  # в единицах; на таком расстоянии от персонажа грузятся области
+# сколько раз мозаичная планета выбирает место появления заново, если рядом
+# с местом, выбранным на грубой планете, нет точек нужного биома
+SPAWN_ATTEMPTS = 4
+# сколько новых областей мозаичная планета генерирует за один выбор мест появления;
+# места в других незагруженных областях выбираются заново среди загруженных
+SPAWN_NEW_REGIONS = 4
+# слой -> тип хранения из STORAGE_DTYPES после генерации, если в data["storage"]
+# не указан другой. int16 оставляет у карт ошибку в тысячные доли единицы, а точки
+# хранятся во float64: во float32 на больших планетах они сдвинулись бы заметно
+LAYER_STORAGE = {
+    "tectonic_map": "uint8",
+    "height_map": "int16",
+    "heat_map": "int16",
+    "precipitation_map": "int16",
+    "biome_map": "uint8",
+}
+
+# стадии генерации планеты: (название, входные стадии, читаемые параметры, результаты)
+PLANET_STAGES = [
+    Stage("points", (), ("radius",), ("points", "cartesian_points")),
+    Stage(
+        "tectonics",
+        ("points",),
+        ("seed", "radius", "tectonics"),
+        ("tectonic_map", "big_tectonic_points", "small_tectonic_points"),
+    ),
+    Stage(
+        "height",
+        ("points", "tectonics"),
+        ("seed", "radius", "tectonics", "height"),
+        (
+            "height_map",
+            "tectonic_shifts",
+            "oceanic_plates",
+            "tectonic_movement",
+            "height_ranges",
+        ),
+        generated=("water_level", "mountain_height"),
+    ),
+    Stage("heat", ("points", "height"), ("temperature",), ("heat_map", "heat_ranges")),
+    Stage(
+        "precipitation",
+        ("points", "height"),
+        ("precipitation",),
+        ("precipitation_map", "precipitation_ranges"),
+    ),
+    Stage("biome", ("height", "heat", "precipitation"), (), ("biome_map",)),
+    Stage(
+        "neighbors", ("points",), ("radius",), ("neighbor_offsets", "neighbor_point_ids")
+    ),
+    # сами локации создаёт generate_locations, стадия только сбрасывает карту локаций
+    Stage("locations", ("points", "biome"), (), ("location_map",), cached=False),
+]
+# параметры всей планеты, которые стадии считают вместе с картами: точки и движение
+# тектонических плит и диапазоны карт до нормализации. По ним мозаичная планета
+# генерирует области так же, как генерировалась бы вся планета
+PLANET_PARAMETERS = (
+    "big_tectonic_points",
+    "small_tectonic_points",
+    "tectonic_shifts",
+    "oceanic_plates",
+    "tectonic_movement",
+    "height_ranges",
+    "heat_ranges",
+    "precipitation_ranges",
+)
+# стадия -> параметры с октавами шума несдвинутых точек, который она читает.
+# Этот шум считается заранее одним проходом для всех выполняемых стадий
+NOISE_OCTAVES = {
+    "tectonics": [
+        ("tectonics", "tectonic_distance_noise_octaves"),
+        ("tectonics", "tectonic_bearing_noise_octaves"),
+    ],
+    "heat": [("temperature", "heat_noise_octaves")],
+    "precipitation": [("precipitation", "precipitation_noise_octaves")],
+}
+
+# biome_id -> биом, в картах биомов хранятся индексы этого списка
+BIOMES: list[str] = list(BIOME_NAMES)
+BIOME_IDS: dict[str, int] = {biome: biome_id for biome_id, biome in enumerate(BIOMES)}
 
 
 class Planet(World):
@@ -40,16 +176,49 @@ class Planet(World):
         super().__init__(data)
 
         self._points: np.typing.NDArray[np.float64] = None
-        self._tree: BallTree = None
+        self._cartesian_points: np.typing.NDArray[np.float64] = None
+        self._octave_noise: dict[int, np.typing.NDArray[np.float64]] = {}
+        self._effective_latitudes: dict[
+            tuple[float, float], np.typing.NDArray[np.float64]
+        ] = {}
+        self._sphere_index: SphereIndex | None = None  # строится при первом запросе
+        # ширина карты -> номера ближайших к пикселям точек, общие для всех слоёв
+        self._map_pixel_indices: dict[int, np.ndarray] = {}
+        self._stage_keys: dict[str, str] = {}  # стадия -> ключ результатов в памяти
+        self._profiler = GenerationProfiler(0)
         self._radius: float = self.data["generation"]["radius"]
 
-        self._tectonic_map: dict[tuple[float, float], int] = {}
-        self._height_map: dict[tuple[float, float], float] = {}
-        self._heat_map: dict[tuple[float, float], float] = {}
-        self._precipitation_map: dict[tuple[float, float], float] = {}
-        self._biome_map: dict[tuple[float, float], str] = {}
-        self._location_map: dict[tuple[float, float], int] = {}
-        self._point_map: dict[int, tuple[float, float]] = {}  # location_id -> point_key
+        # все карты - массивы, выровненные по индексам self._points
+        self._tectonic_map: np.typing.NDArray[np.int32] = None
+        self._height_map: np.typing.NDArray[np.float64] = None
+        self._heat_map: np.typing.NDArray[np.float64] = None
+        self._precipitation_map: np.typing.NDArray[np.float64] = None
+        self._biome_map: np.typing.NDArray[np.uint8] = None  # point_id -> biome_id
+        # point_id -> location_id, то есть location_id_offset + point_id
+        self._location_map: np.typing.NDArray[np.int64] = None
+        # граф соседей на расстоянии шага в формате CSR: соседи точки point_id -
+        # _neighbor_point_ids[_neighbor_offsets[point_id]:_neighbor_offsets[point_id + 1]]
+        self._neighbor_offsets: np.typing.NDArray[np.int64] = None
+        self._neighbor_point_ids: np.typing.NDArray[np.int32] = None
+        self._path_finder: PathFinder | None = None  # строится при первом запросе
+        self._biome_index: BiomeIndex | None = None  # строится при первом запросе
+        # словарь локаций Нейросферы, в котором зарезервированы локации планеты
+        self._location_holder: LocationHolder | None = None
+        # параметры всей планеты, см. PLANET_PARAMETERS
+        self._big_tectonic_points: np.typing.NDArray[np.float64] = None
+        self._small_tectonic_points: np.typing.NDArray[np.float64] = None
+        self._tectonic_shifts: np.typing.NDArray[np.float64] = None  # плита -> (x, y, z)
+        self._oceanic_plates: np.typing.NDArray[np.int64] = None
+        self._tectonic_movement: np.typing.NDArray[np.float64] = (
+            None  # (азимут, скорость)
+        )
+        # (минимум, максимум) каждой нормализованной карты по порядку нормализаций
+        self._height_ranges: np.typing.NDArray[np.float64] = None
+        self._heat_ranges: np.typing.NDArray[np.float64] = None
+        self._precipitation_ranges: np.typing.NDArray[np.float64] = None
+
+        self._walking_distance = 1.1 / self._radius
+        self._walking_speed = 0.1 / self._radius
 
         self._read_data()
 
@@ -64,52 +233,130 @@ polar	tundra	tundra	tundra	taiga	taiga	taiga	plains	plains	plains	plains	plains
 polar	tundra	tundra	tundra	taiga	taiga	plains	plains	steppe	steppe	steppe	steppe	desert	desert	desert	desert	tropical_desert	tropical_desert	tropical_desert	tropical_desert
 polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe	desert	desert	desert	desert	tropical_desert	tropical_desert	tropical_desert	tropical_desert
 """
-        self._biome_table: list[list[str]] = self._table(_biome_string)[::-1]
-
-        self._walking_distance = 1.1 / self._radius
-        self._walking_speed = 0.1 / self._radius
+        self._biome_table: np.typing.NDArray[np.uint8] = self._table(_biome_string)[::-1]
+        self._biome_lookup: np.typing.NDArray[np.uint8] = self._build_biome_lookup(
+            self._biome_table
+        )
 
         # debug
         self._draw_tectonics: bool = False
-        self._borders: list[tuple[float, float]] = []
+        self._borders: list[int] = []  # point_id
 
     # region Методы информации
 
-    def statistics(self) -> None:
-        ground_temperatures = []
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            height = self._height_map[point_key]
-            if height > self.data["generation"]["water_level"]:
-                ground_temperatures.append(self._heat_map[point_key])
-        logging.info(f"Средняя температура: {np.average(list(self._heat_map.values()))}")
-        logging.info(f"Средняя температура на суше: {np.average(ground_temperatures)}")
-
-    def _read_map(self, name: str) -> dict[tuple[float, float]]:
-        output = {}
-        for i in self.data["maps"][name]:
-            lat, lon, value = i
-            output[(lat, lon)] = value
-        return output
+    def statistics(self) -> dict:
+        """Статистика мира (см. statistics.py). Считается один раз и хранится
+        в data["statistics"], пока не изменится какой-нибудь слой."""
+        if self.data.get("statistics") is None:
+            self.data["statistics"] = compute_statistics(
+                {
+                    name: self._get_layer(name)
+                    for name in (
+                        "tectonic_map",
+                        "height_map",
+                        "heat_map",
+                        "precipitation_map",
+                        "biome_map",
+                    )
+                },
+                BIOMES,
+                self.data["generation"],
+            )
+        return self.data["statistics"]
+
+    def _get_layer(self, name: str) -> np.ndarray:
+        """Значения слоя name, в каком бы типе он ни хранился"""
+        stored = self.data.get("stored_layers", {}).get(name)
+        return decode(
+            getattr(self, f"_{name}"), None if stored is None else stored["scale"]
+        )
+
+    def _get_storage_dtype(self, name: str, default) -> np.dtype:
+        stored = self.data.get("stored_layers", {}).get(name)
+        if stored is None:
+            return np.dtype(default)
+        return np.dtype(stored.get("dtype", STORAGE_DTYPES[stored["type"]]))
+
+    def _read_map(self, name: str, dtype) -> np.ndarray:
+        json_map = self.data["maps"][name]
+        if not json_map or not isinstance(json_map[0], list):
+            return np.array(json_map, dtype=dtype)
+
+        # старый формат сохранений: [lat, lon, value] для каждой точки
+        point_ids = {tuple(point.tolist()): i for i, point in enumerate(self._points)}
+        output = [None] * len(self._points)
+        for lat, lon, value in json_map:
+            output[point_ids[(lat, lon)]] = value
+        return np.array(output, dtype=dtype)
 
     def _read_data(self) -> None:
-        self._points = np.array(self.data["points"])
-        if self._points.size:
-            self._tree = BallTree(self._points, metric="haversine")
-
-        self._tectonic_map = self._read_map("tectonic_map")
-        self._height_map = self._read_map("height_map")
-        self._heat_map = self._read_map("heat_map")
-        self._precipitation_map = self._read_map("precipitation_map")
-        self._biome_map = self._read_map("biome_map")
-        self._location_map = self._read_map("location_map")
-        self._point_map = {v: k for k, v in self._location_map.items()}
-
-    def _write_map(self, map_: dict[tuple[float, float]], name: str) -> None:
-        json_map = [
-            [point_key[0], point_key[1], value] for point_key, value in map_.items()
-        ]
-        self.data["maps"][name] = json_map
+        self._sphere_index = None
+        self._map_pixel_indices = {}
+        self._path_finder = None
+        self._biome_index = None
+        if self.data.get("arrays"):
+            self._read_arrays(self.data["arrays"])
+        else:
+            self._read_json_maps()
+        if self._neighbor_offsets is None:
+            # сохранения без графа соседей
+            self._generate_neighbor_graph()
+        if (
+            "location_id_offset" not in self.data
+            and len(self._location_map)
+            and self._location_map[0] >= 0
+        ):
+            # в старых сохранениях offset не записан, но локации создавались подряд
+            self.data["location_id_offset"] = int(self._location_map[0])
+
+    def _read_json_maps(self) -> None:
+        self._points = np.array(
+            self.data["points"], dtype=self._get_storage_dtype("points", np.float64)
+        ).reshape(-1, 2)
+        for name, default in (
+            ("tectonic_map", np.int32),
+            ("height_map", np.float64),
+            ("heat_map", np.float64),
+            ("precipitation_map", np.float64),
+        ):
+            setattr(
+                self,
+                f"_{name}",
+                self._read_map(name, self._get_storage_dtype(name, default)),
+            )
+        self._biome_map = self._read_biome_map()
+        self._location_map = self._read_map("location_map", np.int64)
+
+    @staticmethod
+    def _read_array(directory: str, name: str) -> np.ndarray:
+        # copy-on-write mmap: с диска читаются только нужные страницы,
+        # а изменения в памяти не попадают в файл
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="c")
+
+    def _read_arrays(self, directory: str) -> None:
+        self._points = self._read_array(directory, "points")
+        self._tectonic_map = self._read_array(directory, "tectonic_map")
+        self._height_map = self._read_array(directory, "height_map")
+        self._heat_map = self._read_array(directory, "heat_map")
+        self._precipitation_map = self._read_array(directory, "precipitation_map")
+        self._biome_map = self._read_array(directory, "biome_map")
+        self._location_map = self._read_array(directory, "location_map")
+        if os.path.exists(os.path.join(directory, "neighbor_offsets.npy")):
+            self._neighbor_offsets = self._read_array(directory, "neighbor_offsets")
+            self._neighbor_point_ids = self._read_array(directory, "neighbor_point_ids")
+        for name in PLANET_PARAMETERS:
+            if os.path.exists(os.path.join(directory, f"{name}.npy")):
+                setattr(self, f"_{name}", self._read_array(directory, name))
+
+    def _read_biome_map(self) -> np.ndarray:
+        biome_map = self._read_map("biome_map", object)
+        if biome_map.size and isinstance(biome_map[0], str):
+            # старые сохранения хранят названия биомов
+            return np.array([BIOME_IDS[biome] for biome in biome_map], dtype=np.uint8)
+        return biome_map.astype(np.uint8)
+
+    def _write_map(self, map_: np.ndarray, name: str) -> None:
+        self.data["maps"][name] = map_.tolist()
 
     def _write_data(self) -> None:
         self.data["points"] = self._points.tolist()
@@ -120,58 +367,380 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
         self._write_map(self._biome_map, "biome_map")
         self._write_map(self._location_map, "location_map")
 
+    @staticmethod
+    def _write_array(directory: str, name: str, array: np.ndarray) -> None:
+        path = os.path.join(directory, f"{name}.npy")
+        # пишем через временный файл, чтобы не испортить массивы,
+        # открытые через mmap из этого же файла
+        with open(f"{path}.tmp", "wb") as file:
+            np.save(file, array)
+        os.replace(f"{path}.tmp", path)
+
+    def write_arrays(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self._write_array(directory, "points", self._points)
+        self._write_array(directory, "tectonic_map", self._tectonic_map)
+        self._write_array(directory, "height_map", self._height_map)
+        self._write_array(directory, "heat_map", self._heat_map)
+        self._write_array(directory, "precipitation_map", self._precipitation_map)
+        self._write_array(directory, "biome_map", self._biome_map)
+        self._write_array(directory, "location_map", self._location_map)
+        self._write_array(directory, "neighbor_offsets", self._neighbor_offsets)
+        self._write_array(directory, "neighbor_point_ids", self._neighbor_point_ids)
+        for name in PLANET_PARAMETERS:
+            if getattr(self, f"_{name}") is not None:
+                self._write_array(directory, name, getattr(self, f"_{name}"))
+
+        self.data["arrays"] = directory
+        self.data["points"] = []
+        self.data["maps"] = {name: [] for name in self.data["maps"]}
+
     def to_dict(self):
-        self._write_data()
+        if not self.data.get("arrays"):
+            self._write_data()
         return super().to_dict()
 
     @staticmethod
-    def _table(biome_string) -> list[list[str]]:
-        return [line.split("\t") for line in biome_string.split("\n") if line]
+    def _table(biome_string) -> np.ndarray:
+        return np.array(
+            [
+                [BIOME_IDS[biome] for biome in line.split("\t")]
+                for line in biome_string.split("\n")
+                if line
+            ],
+            dtype=np.uint8,
+        )
+
+    @staticmethod
+    def _build_biome_lookup(biome_table: np.ndarray) -> np.ndarray:
+        """Таблица [класс высоты, мороз, осадки, температура] -> biome_id.
+        Классы высоты: 0 - под водой, 1 - суша, 2 - горы."""
+        lookup = np.empty((3, 2, *biome_table.shape), dtype=np.uint8)
+        lookup[0, 0] = BIOME_IDS["marine"]
+        lookup[0, 1] = BIOME_IDS["glacier"]
+        lookup[1] = biome_table
+        lookup[2, 0] = BIOME_IDS["mountain"]
+        lookup[2, 1] = BIOME_IDS["snowy_mountain"]
+        return lookup
+
+    def _get_biome(self, point_id: int) -> str:
+        return BIOMES[self._biome_map[point_id]]
+
+    def _set_biome(self, point_id: int, biome: str) -> None:
+        """Меняет биом точки и всё, что от него зависит"""
+        self._biome_map[point_id] = BIOME_IDS[biome]
+        self.data["statistics"] = None
+        self._path_finder = None  # стоимости рёбер считаются по биомам
+        if self._biome_index is not None:
+            self._biome_index.move(point_id, BIOME_IDS[biome])
+        if self._location_holder is not None and "location_id_offset" in self.data:
+            location = self._location_holder.get_created(
+                self._get_location_ids([point_id])[0]
+            )
+            if location is not None:
+                location.set_biome(biome)
+
+    def _get_point(self, point_id: int) -> np.ndarray:
+        """Широта и долгота точки"""
+        return self._points[point_id]
+
+    def _get_point_id(self, location_id: int) -> int:
+        return location_id - self.data["location_id_offset"]
+
+    def _get_location_ids(self, point_ids) -> list[int]:
+        return (np.asarray(point_ids) + self.data["location_id_offset"]).tolist()
 
     # endregion Методы информации
 
     # region Методы генерации
 
-    def generate(self) -> None:
-        start_time = time.time()
+    def generate(self, progress: ProgressCallback | None = None) -> None:
+        """Генерирует планету по графу стадий PLANET_STAGES.
 
+        Стадия с тем же ключом, что и в прошлой генерации, не выполняется,
+        результаты остальных берутся из кэша генерации, если они там есть.
+        О начале каждого уровня стадий сообщает через progress.
+        Отчёт профилировщика о стадиях сохраняется в data["generation_profile"],
+        статистика мира - в data["statistics"]. Стадии считаются в полной точности, а готовые слои переводятся
+        в типы LAYER_STORAGE и data["storage"] через set_storage.
+        """
         # устанавливаем сид
         seed = self.data["generation"]["seed"]
         if seed is None:
             seed = random.randint(0, 100000)
             self.data["generation"]["seed"] = seed
-        random.seed(seed)
         logging.info(f"Seed: {seed}")
 
-        # генерируем точки на сфере
-        self._points = self._generate_sphere_points()
-        self._tree = BallTree(self._points, metric="haversine")
+        self.data["arrays"] = None
+        self.data["statistics"] = None
+        self._path_finder = None  # пути по старой карте устарели
+        self._biome_index = None
+        self._radius = self.data["generation"]["radius"]
+        self._walking_distance = 1.1 / self._radius
+        self._walking_speed = 0.1 / self._radius
 
-        # генерируем карты
-        self._generate_tectonic_map()
-        self._generate_height_map()
-        self._generate_heat_map()
-        self._generate_precipitation_map()
-        self._generate_biome_map()
+        self._profiler = GenerationProfiler(self._get_points_number())
+        with self._profiler.stage("planet"):
+            self._generate_stages(progress)
+            with self._profiler.stage("storage"):
+                report = self.set_storage(
+                    {**LAYER_STORAGE, **self.data.get("storage", {})}
+                )
+            with self._profiler.stage("statistics"):
+                self.statistics()
+        self.data["generation_profile"] = self._profiler.report
+        logging.info(f"Точность хранения слоёв:\n{format_storage_report(report)}")
+
+    def set_storage(self, storage: dict[str, str]) -> dict[str, dict]:
+        """Переводит слои в другую точность хранения. Слои, которые уже хранятся
+        в нужном типе, не трогаются, и в отчёте остаётся их прошлая запись.
+
+        Args:
+            storage: Слой (например, "height_map") -> тип из STORAGE_DTYPES.
+
+        Returns:
+            Отчёт об ошибке квантования и размере каждого слоя,
+            он же сохраняется в data["storage_report"].
+        """
+        stored_layers = self.data.setdefault("stored_layers", {})
+        previous_report = self.data.get("storage_report") or {}
+        report = {}
+        for name, storage_type in storage.items():
+            stored = stored_layers.get(name)
+            if (
+                stored is not None
+                and stored["type"] == storage_type
+                and name in previous_report
+            ):
+                report[name] = previous_report[name]
+                continue
+            values = self._get_layer(name)
+            array, scale = encode(values, storage_type)
+            report[name] = quantization_error(values, array, scale)
+            setattr(self, f"_{name}", array)
+            stored_layers[name] = {
+                "type": storage_type,
+                "dtype": array.dtype.name,  # другой, если значения не влезли в type
+                "scale": scale,
+            }
 
-        logging.info(f"Генерация планеты: {time.time() - start_time:.2f}с")
+        self._path_finder = None  # веса рёбер считаются по высотам
+        self.data["statistics"] = None
+        self.data["storage_report"] = report
+        return report
+
+    def _generate_stages(self, progress: ProgressCallback | None) -> None:
+        stage_keys = self._get_stage_keys()
+        if self._stage_keys.get("points") != stage_keys["points"]:
+            # точки изменятся - всё посчитанное по старым точкам устарело
+            self._octave_noise = {}
+            self._effective_latitudes = {}
+            self._sphere_index = None
+            self._map_pixel_indices = {}
+
+        # стадия -> папка в кэше или None, если стадию нужно выполнить.
+        # Стадии с тем же ключом, что и у результатов в памяти, здесь нет
+        plan = {}
+        for stage in PLANET_STAGES:
+            key = stage_keys[stage.name]
+            if self._stage_keys.get(stage.name) != key:
+                plan[stage.name] = GENERATION_CACHE.get(key) if stage.cached else None
+        self._plan_stored_inputs(plan, stage_keys)
+        running_stage_names = [name for name, path in plan.items() if path is None]
+
+        done_stages_number = 0
+        with StagePool(self._get_points_number()) as pool:
+            for level in stage_levels(PLANET_STAGES):
+                if progress is not None:
+                    progress(
+                        ", ".join(stage.name for stage in level),
+                        done_stages_number / len(PLANET_STAGES),
+                    )
+                done_stages_number += len(level)
+
+                stages = []  # стадии уровня, которые нужно выполнить
+                for stage in level:
+                    if stage.name not in plan:
+                        continue
+                    if plan[stage.name] is not None:
+                        with self._profiler.stage(stage.name, cached=True):
+                            self._read_stage(stage, plan[stage.name])
+                    else:
+                        stages.append(stage)
+
+                if any(stage.name in NOISE_OCTAVES for stage in stages):
+                    self._generate_octave_noise(pool, running_stage_names)
+
+                # стадии уровня выполняются одновременно, если возвращают Future
+                futures = []
+                for stage in stages:
+                    with self._profiler.stage(stage.name):
+                        futures.append((stage, self._run_stage(stage, pool)))
+                if any(future is not None for _, future in futures):
+                    with self._profiler.stage("pool_wait"):
+                        for stage, future in futures:
+                            if future is None:
+                                continue
+                            for name, result in zip(
+                                stage.outputs, future.result(), strict=True
+                            ):
+                                setattr(self, f"_{name}", result)
+
+                cached_stages = [stage for stage in stages if stage.cached]
+                if cached_stages:
+                    with self._profiler.stage("cache_write"):
+                        for stage in cached_stages:
+                            GENERATION_CACHE.put(
+                                stage_keys[stage.name],
+                                lambda directory, stage=stage: self._write_stage(
+                                    stage, directory
+                                ),
+                            )
+
+                for stage in level:
+                    self._stage_keys[stage.name] = stage_keys[stage.name]
+
+    def _plan_stored_inputs(self, plan: dict[str, str | None], stage_keys) -> None:
+        """Добавляет в план входы выполняемых стадий, которые set_storage перевёл
+        в другую точность: стадии считают по результатам в полной точности,
+        поэтому такие входы заново читаются из кэша, а если их там нет - считаются.
+        Остальные результаты стадий в памяти остаются как есть."""
+        stored_layers = self.data.get("stored_layers", {})
+        stages = {stage.name: stage for stage in PLANET_STAGES}
+        while True:
+            inputs = {
+                name
+                for stage_name, path in plan.items()
+                if path is None
+                for name in stages[stage_name].inputs
+                if name not in plan
+                and any(output in stored_layers for output in stages[name].outputs)
+            }
+            if not inputs:
+                return
+            for name in inputs:
+                stage = stages[name]
+                plan[name] = (
+                    GENERATION_CACHE.get(stage_keys[name]) if stage.cached else None
+                )
 
-    def generate_locations(self, location_holder) -> None:
-        for point in self._points:
-            new_id_ = new_id(location_holder)
-            point_key = tuple(point.tolist())
-            location = self._generate_location(point_key, new_id_)
-            location_holder[new_id_] = location
+    def _run_stage(self, stage: Stage, pool: StagePool) -> Future | None:
+        """Выполняет стадию. Стадия, которая считается в пуле,
+        возвращает Future с кортежем результатов в порядке stage.outputs."""
+        seed = self.data["generation"]["seed"]
+        # результаты прошлой генерации не используются, а считаются заново
+        for name in stage.outputs:
+            setattr(self, f"_{name}", None)
+            self.data.get("stored_layers", {}).pop(name, None)
+        if stage.name == "points":
+            self._points = self._generate_sphere_points()
+            self._cartesian_points = self._spherical_to_cartesian(
+                self._points[:, 0], self._points[:, 1]
+            ).T
+        elif stage.name == "tectonics":
+            self._generate_tectonic_map(stage_rng(seed, "tectonics"))
+        elif stage.name == "height":
+            self._generate_height_map(pool, stage_rng(seed, "height"))
+        elif stage.name == "heat":
+            return self._generate_heat_map(pool)
+        elif stage.name == "precipitation":
+            return self._generate_precipitation_map(pool)
+        elif stage.name == "biome":
+            self._generate_biome_map()
+        elif stage.name == "neighbors":
+            self._generate_neighbor_graph()
+        elif stage.name == "locations":
+            self._location_map = np.full(len(self._points), -1, dtype=np.int64)
+        else:
+            raise ValueError(f"Unknown stage: {stage.name}")
+        return None
+
+    def _get_stage_keys(self) -> dict[str, str]:
+        """Ключ стадии - хэш читаемых ею параметров и ключей её входных стадий,
+        поэтому изменение параметра меняет ключи стадии и всех зависящих от неё"""
+        generation = self.data["generation"]
+        keys = {}
+        for stage in PLANET_STAGES:
+            description = {
+                "stage": stage.name,
+                "parameters": {name: generation[name] for name in stage.parameters},
+                "inputs": [keys[name] for name in stage.inputs],
+            }
+            keys[stage.name] = GENERATION_CACHE.key(
+                self.data["type"], description, GENERATOR_VERSION
+            )
+        return keys
 
-            self._location_map[point_key] = new_id_
-            self._point_map[new_id_] = point_key
+    def _write_stage(self, stage: Stage, directory: str) -> None:
+        for name in stage.outputs:
+            self._write_array(directory, name, getattr(self, f"_{name}"))
+        generated_parameters = {
+            name: self.data["generation"][name] for name in stage.generated
+        }
+        with open(os.path.join(directory, "generation.json"), "w", encoding="utf-8") as f:
+            json.dump(generated_parameters, f)
+
+    def _read_stage(self, stage: Stage, directory: str) -> None:
+        for name in stage.outputs:
+            setattr(self, f"_{name}", self._read_array(directory, name))
+            self.data.get("stored_layers", {}).pop(name, None)
+        with open(os.path.join(directory, "generation.json"), encoding="utf-8") as f:
+            self.data["generation"].update(json.load(f))
+
+    def _generate_region_maps(self, points: np.ndarray) -> None:
+        """Генерирует карты и граф соседей точек points (широты и долготы) по уже
+        заданным параметрам всей планеты (PLANET_PARAMETERS) и уровням воды и гор.
+
+        У точек с краю не хватает соседей для графа и конфликта плит,
+        поэтому точки берутся с запасом вокруг нужной области.
+        """
+        self._points = points
+        self._cartesian_points = self._spherical_to_cartesian(
+            self._points[:, 0], self._points[:, 1]
+        ).T
+        self._octave_noise = {}
+        self._effective_latitudes = {}
+        self._sphere_index = None
+        self._map_pixel_indices = {}
+
+        self._profiler = GenerationProfiler(len(points))
+        with self._profiler.stage("region"), StagePool(len(points), 1) as pool:
+            self._generate_tectonic_map(None)
+            self._generate_height_map(pool, None)
+            self._heat_map, _ = self._generate_heat_map(pool).result()
+            self._precipitation_map, _ = self._generate_precipitation_map(pool).result()
+            self._generate_biome_map()
+            self._generate_neighbor_graph()
+
+    def generate_locations(self, location_holder: LocationHolder) -> None:
+        """Резервирует локациям всех точек один диапазон id: id локации -
+        location_id_offset + id точки. Сами локации создаются при первом обращении."""
+        points_number = self._get_points_number()
+        offset = location_holder.reserve(points_number, self._create_location)
+        self._location_holder = location_holder
+        self.data["location_id_offset"] = offset
+        self._location_map = np.arange(offset, offset + points_number, dtype=np.int64)
+
+    def attach_locations(self, location_holder: LocationHolder) -> None:
+        self._location_holder = location_holder
+        if "location_id_offset" in self.data:
+            location_holder.reserve(
+                self._get_points_number(),
+                self._create_location,
+                self.data["location_id_offset"],
+            )
+
+    def _create_location(self, location_id: int) -> Location:
+        return self._generate_location(
+            location_id, self._get_biome(self._get_point_id(location_id))
+        )
 
-    def _generate_location(self, point_key, location_id):
+    def _generate_location(self, location_id: int, biome: str):
         return Location(
             {
                 "id": location_id,
                 "world_id": self.data["id"],
-                "biome": self._biome_map[point_key],
+                "biome": biome,
                 "references": {
                     "structures": [],
                     "characters": [],
@@ -180,38 +749,57 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
             }
         )
 
+    def _get_points_number(self) -> int:
+        return round(4 * np.pi * self._radius**2)
+
     def _generate_sphere_points(self):
         """Генерирует n точек (вычисляется по площади сферы) на сфере и возвращает массив из широты и долготы"""
-        n = round(4 * np.pi * self._radius**2)
-        indices = np.arange(n, dtype=np.float32) + 0.5
-        phi = np.arccos(1 - 2 * indices / n)
-        theta = (np.pi * (1 + 5**0.5)) * indices
-        latitude = np.pi / 2 - phi
-        longitude = theta % (2 * np.pi)
-        return np.column_stack((latitude, longitude))
-
-    def _generate_tectonic_map(self):
-        start_time = time.time()
-
-        noise_point_keys = self._generate_tectonic_noise_point_keys()
-
-        big_tectonics_tree, small_plate_generation_points = (
-            self._generate_big_tectonic_plates(
-                noise_point_keys,
-            )
-        )
+        n = self._get_points_number()
+        return fibonacci_points(np.arange(n), n)
+
+    def _generate_octave_noise(self, pool: StagePool, stage_names: list[str]) -> None:
+        """Заранее считает по частям в пуле октавы шума несдвинутых точек для стадий
+        stage_names: шумы тектоники, тепла и осадков не зависят друг от друга
+        и от других стадий"""
+        generation_data = self.data["generation"]
+        octaves = {
+            octave
+            for stage_name in stage_names
+            for block, name in NOISE_OCTAVES.get(stage_name, [])
+            for octave in generation_data[block][name]
+        } - self._octave_noise.keys()
+        if not octaves:
+            return
+        with self._profiler.stage("octave_noise", octaves=max(octaves)):
+            chunks = pool.map_points(pnoise3_octaves, self._cartesian_points, octaves)
+            for octave in octaves:
+                self._octave_noise[octave] = np.concatenate(
+                    [chunk[octave] for chunk in chunks]
+                )
 
-        self._generate_small_tectonic_plates(
-            noise_point_keys,
-            big_tectonics_tree,
-            small_plate_generation_points,
-        )
+    def _generate_tectonic_map(self, rng: np.random.Generator | None):
+        self._tectonic_map = np.full(len(self._points), -1, dtype=np.int32)
+        with self._profiler.stage("noise_points"):
+            noise_points = self._generate_tectonic_noise_points()
 
-        logging.info(f"Генерация тектонических плит: {time.time() - start_time:.2f}с")
+        with self._profiler.stage("big_plates"):
+            nearest_big_plates, small_plate_generation_point_ids = (
+                self._generate_big_tectonic_plates(
+                    rng,
+                    noise_points,
+                )
+            )
 
-    def _generate_tectonic_noise_point_keys(self):
-        noise_point_keys: dict[tuple[float, float], tuple[float, float]] = {}
+        with self._profiler.stage("small_plates"):
+            self._generate_small_tectonic_plates(
+                rng,
+                noise_points,
+                nearest_big_plates,
+                small_plate_generation_point_ids,
+            )
 
+    def _generate_tectonic_noise_points(self):
+        """Возвращает точки, сдвинутые шумом, выровненные по self._points"""
         tectonics_data = self.data["generation"]["tectonics"]
 
         noise_map_distance = self._generate_perlin_noise(
@@ -223,522 +811,490 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
             tectonics_data["tectonic_bearing_noise_coefficients"],
         )
 
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            noise_distance = noise_map_distance[point_key] / self._radius
-            noise_bearing = noise_map_bearing[point_key]
-            lat, lon = point
-            noise_point_keys[point_key] = self._haversine_move(
-                lat, lon, noise_bearing, noise_distance
-            )
+        noise_distance = noise_map_distance / self._radius
+        new_lat, new_lon = self._haversine_move(
+            self._points[:, 0], self._points[:, 1], noise_map_bearing, noise_distance
+        )
+        return np.column_stack((new_lat, new_lon))
 
-        return noise_point_keys
+    def _generate_big_tectonic_plates(
+        self, rng: np.random.Generator | None, noise_points
+    ):
+        """Распределяет точки по большим плитам. Точки плит выбираются через rng,
+        если их ещё нет.
 
-    def _generate_big_tectonic_plates(self, noise_point_keys):
+        Returns:
+            Ближайшую большую плиту для каждой точки и id точек у границ больших плит,
+            из которых будут сгенерированы малые плиты.
+        """
         tectonics_data = self.data["generation"]["tectonics"]
 
-        random_points = np.array(
-            random.choices(self._points, k=tectonics_data["big_tectonics_number"])
-        )
-        big_tectonics_points = self._relaxate_points(random_points)
-        big_tectonics_tree = BallTree(big_tectonics_points, metric="haversine")
-
-        small_plate_generation_points: list[tuple[float, float]] = []
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            query_point = [noise_point_keys[point_key]]
-            dist, indices = big_tectonics_tree.query(query_point, k=2)
-            dist, indices = dist[0], indices[0]
-
-            distance_delta = abs(dist[0] - dist[1])
-            if distance_delta < tectonics_data["small_tectonics_delta"]:
-                small_plate_generation_points.append(point)
-            else:
-                self._tectonic_map[point_key] = int(indices[0])
+        if self._big_tectonic_points is None:
+            random_points = self._points[
+                rng.integers(
+                    len(self._points), size=tectonics_data["big_tectonics_number"]
+                )
+            ]
+            self._big_tectonic_points = self._relaxate_points(random_points)
+        big_tectonics_index = SphereIndex(self._big_tectonic_points)
+
+        dist, indices = big_tectonics_index.k_nearest(noise_points, k=2)
+        nearest_big_plates = indices[:, 0]
 
-        return big_tectonics_tree, small_plate_generation_points
+        distance_delta = np.abs(dist[:, 0] - dist[:, 1])
+        near_border = distance_delta < tectonics_data["small_tectonics_delta"]
+        self._tectonic_map[~near_border] = nearest_big_plates[~near_border]
+
+        return nearest_big_plates, np.flatnonzero(near_border)
 
     def _generate_small_tectonic_plates(
         self,
-        noise_point_keys,
-        big_tectonics_tree,
-        small_plate_generation_points,
+        rng: np.random.Generator | None,
+        noise_points,
+        nearest_big_plates,
+        small_plate_generation_point_ids,
     ):
         tectonics_data = self.data["generation"]["tectonics"]
 
-        small_tectonics_points = np.array(
-            random.choices(
-                small_plate_generation_points,
-                k=tectonics_data["small_tectonics_number"],
-            )
-        )
-        small_tectonics_tree = BallTree(small_tectonics_points, metric="haversine")
-
-        for point in small_plate_generation_points:
-            point_key = tuple(point.tolist())
-            query_point = [noise_point_keys[point_key]]
-            dist, indices = small_tectonics_tree.query(query_point, k=1)
-            dist, indices = dist[0], indices[0]
-            dist, index = (
-                dist[0],
-                indices[0] + tectonics_data["big_tectonics_number"],
-            )
+        if self._small_tectonic_points is None:
+            small_tectonics_point_ids = small_plate_generation_point_ids[
+                rng.integers(
+                    len(small_plate_generation_point_ids),
+                    size=tectonics_data["small_tectonics_number"],
+                )
+            ]
+            self._small_tectonic_points = self._points[small_tectonics_point_ids]
+        small_tectonics_index = SphereIndex(self._small_tectonic_points)
 
-            if dist > tectonics_data["small_tectonics_max_distance"]:
-                index = big_tectonics_tree.query(query_point, k=1, return_distance=False)[
-                    0
-                ][0]
-            self._tectonic_map[point_key] = int(index)
+        dist, indices = small_tectonics_index.nearest(
+            noise_points[small_plate_generation_point_ids]
+        )
+        plates = indices + tectonics_data["big_tectonics_number"]
 
-    def _generate_height_map(self):
-        start_time = time.time()
+        # слишком далёкие от малых плит точки остаются на ближайшей большой плите
+        too_far = dist > tectonics_data["small_tectonics_max_distance"]
+        plates[too_far] = nearest_big_plates[small_plate_generation_point_ids[too_far]]
+        self._tectonic_map[small_plate_generation_point_ids] = plates
 
+    def _generate_height_map(self, pool: StagePool, rng: np.random.Generator | None):
+        """Параметры плит и диапазоны карт выбираются через rng и считаются,
+        если их ещё нет. Уровни воды и гор считаются только вместе с диапазонами:
+        у области мозаичной планеты они уже посчитаны по всей планете."""
         height_data = self.data["generation"]["height"]
         tectonics_data = self.data["generation"]["tectonics"]
         tectonics_number: int = (
             tectonics_data["big_tectonics_number"]
             + tectonics_data["small_tectonics_number"]
         )
+        whole_planet = self._height_ranges is None
+        ranges = [] if whole_planet else self._height_ranges.tolist()
 
-        self._generate_height_noise(tectonics_number)
+        with self._profiler.stage("noise"):
+            self._generate_height_noise(pool, rng, tectonics_number, ranges)
 
         # распределение плит на океанические и континентальные
-        numbers = list(range(tectonics_number))
-        random.shuffle(numbers)
-        ratio = round(len(numbers) * height_data["oceanic_plates_ratio"])
-        oceanic_plates = numbers[:ratio]
+        if self._oceanic_plates is None:
+            ratio = round(tectonics_number * height_data["oceanic_plates_ratio"])
+            self._oceanic_plates = rng.permutation(tectonics_number)[:ratio]
+        oceanic_plates = self._oceanic_plates.tolist()
 
-        self._add_plate_type_delta_to_height_map(oceanic_plates)
+        with self._profiler.stage("plate_type"):
+            self._add_plate_type_delta_to_height_map(oceanic_plates)
 
-        self._add_plate_conflict_to_height_map(tectonics_number, oceanic_plates)
+        with self._profiler.stage("plate_conflict"):
+            self._add_plate_conflict_to_height_map(rng, tectonics_number, oceanic_plates)
 
-        self._height_map = self._normalize_map_by_min_max(
+        self._height_map = self._normalize_map_by_ranges(
             self._height_map,
             height_data["min_height"],
             height_data["max_height"],
+            ranges,
+            1,
         )
+        self._height_ranges = np.array(ranges)
+        if not whole_planet:
+            return
 
         # считаем уровень моря и гор
-        self.data["generation"]["water_level"] = np.percentile(
-            np.array(list(self._height_map.values())),
-            height_data["water_percentage"],
+        self.data["generation"]["water_level"] = float(
+            np.percentile(self._height_map, height_data["water_percentage"])
         )
 
-        self.data["generation"]["mountain_height"] = np.percentile(
-            np.array(list(self._height_map.values())),
-            100 - height_data["mountain_percentage"],
+        self.data["generation"]["mountain_height"] = float(
+            np.percentile(self._height_map, 100 - height_data["mountain_percentage"])
         )
 
         # debug
         if self._draw_tectonics:
             self._draw_tectonic_borders()
 
-        logging.info(f"Генерация карты высот: {time.time() - start_time:.2f}с")
-
-    def _generate_height_noise(self, tectonics_number) -> None:
+    def _generate_height_noise(
+        self,
+        pool: StagePool,
+        rng: np.random.Generator | None,
+        tectonics_number,
+        ranges: list,
+    ) -> None:
         """Заполняет self.heigth_map значениями шума от 0 до 1 с разным сдвигом по плитам"""
         height_data = self.data["generation"]["height"]
 
-        tectonic_shifts = [
-            np.array(
-                [
-                    (random.random() - 0.5) * 2,
-                    (random.random() - 0.5) * 2,
-                    (random.random() - 0.5) * 2,
-                ]
-            )
-            for _ in range(tectonics_number)
-        ]
+        if self._tectonic_shifts is None:
+            self._tectonic_shifts = rng.uniform(-1, 1, size=(tectonics_number, 3))
 
-        for point_key in self._tectonic_map:
-            index = self._tectonic_map[point_key]
-            x, y, z = self._spherical_to_cartesian(*point_key) + tectonic_shifts[index]
-            noise_value = 0
-            for octave, k in zip(
-                height_data["height_noise_octaves"],
-                height_data["height_noise_coefficients"],
-            ):
-                noise_value += k * noise.pnoise3(x, y, z, octaves=octave)
-            self._height_map[point_key] = noise_value
-        self._height_map = self._normalize_map_by_min_max(self._height_map, 0, 1)
+        chunks = pool.map_points(
+            layered_pnoise3,
+            self._cartesian_points + self._tectonic_shifts[self._tectonic_map],
+            height_data["height_noise_octaves"],
+            height_data["height_noise_coefficients"],
+        )
+        self._height_map = np.concatenate(chunks)
+        self._height_map = self._normalize_map_by_ranges(
+            self._height_map, 0, 1, ranges, 0
+        )
 
     def _add_plate_type_delta_to_height_map(self, oceanic_plates):
         height_data = self.data["generation"]["height"]
-        for point in self._points:
-            point_key: tuple[float, float] = tuple(point.tolist())
-            tectonic_index = self._height_map[point_key]
-            if tectonic_index in oceanic_plates:
-                self._height_map[point_key] += height_data["oceanic_plate_height_delta"]
-            else:
-                self._height_map[point_key] += height_data[
-                    "continental_plate_height_delta"
-                ]
+        # проверяется именно _height_map, а не _tectonic_map, как в исходной
+        # генерации: иначе изменятся высоты уже созданных по сиду миров
+        self._height_map += np.where(
+            np.isin(self._height_map, oceanic_plates),
+            height_data["oceanic_plate_height_delta"],
+            height_data["continental_plate_height_delta"],
+        )
 
-    def _add_plate_conflict_to_height_map(self, tectonics_number, oceanic_plates):
+    def _add_plate_conflict_to_height_map(
+        self, rng: np.random.Generator | None, tectonics_number, oceanic_plates
+    ):
         height_data = self.data["generation"]["height"]
-        tectonic_movement: list[tuple[float, float]] = [
-            (
-                random.random() * 2 * np.pi,
-                random.random() * height_data["max_tectonic_speed"],
+        if self._tectonic_movement is None:
+            self._tectonic_movement = np.column_stack(
+                (
+                    rng.uniform(0, 2 * np.pi, size=tectonics_number),
+                    rng.uniform(
+                        0, height_data["max_tectonic_speed"], size=tectonics_number
+                    ),
+                )
             )
-            for _ in range(tectonics_number)
-        ]
         mountain_width = (
             self.data["generation"]["height"]["mountain_width_in_units"] / self._radius
         )
-        for point1 in self._points:
-            point_key_1 = tuple(point1.tolist())
-            lat, lon = point_key_1
-            nearest_points = self._find_nearest_points_by_distance(
-                lat, lon, mountain_width
-            )
-            tectonic_index_1 = self._tectonic_map[point_key_1]
-            conflict_height_delta = 0
-            for point2 in nearest_points:
-                x1, y1 = point1
-                x2, y2 = point2
-
-                if (x1, y1) == (x2, y2):
-                    continue
-
-                point_key_2 = tuple(point2.tolist())
-                tectonic_index_2 = self._tectonic_map[point_key_2]
-                if tectonic_index_1 == tectonic_index_2:
-                    continue
-
-                # вычисляем конфликт векторов AB и CD
-                point_a: tuple[float, float] = point_key_1
-                vector1: tuple[float, float] = tectonic_movement[tectonic_index_1]
-                point_b = self._haversine_move(*point_a, *vector1)
-
-                point_c: tuple[float, float] = point_key_2
-                vector2: tuple[float, float] = tectonic_movement[tectonic_index_2]
-                point_d = self._haversine_move(*point_c, *vector2)
-
-                conflict = self._calculate_vector_conflict(
-                    point_a, point_b, point_c, point_d
-                )
-
-                if (
-                    tectonic_index_1 in oceanic_plates
-                    and tectonic_index_2 in oceanic_plates
-                ):
-                    k = height_data["oceanic_tectonic_conflict_coefficient"]
-                else:
-                    k = height_data["tectonic_conflict_coefficient"]
-                conflict_height_delta += (
-                    conflict / (2 * height_data["max_tectonic_speed"]) * k
-                )
-            self._height_map[point_key_1] += conflict_height_delta
-
-    def _draw_tectonic_borders(self):
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            tectonic_index = self._height_map[point_key]
-            lat, lon = point
-            nearest_points = self._find_nearest_points_by_distance(
-                lat, lon, 1.1 / self._radius
+        is_oceanic = np.zeros(tectonics_number, dtype=bool)
+        is_oceanic[oceanic_plates] = True
+
+        # точка B для каждой точки A - сдвиг A по движению её плиты
+        bearing, distance = self._tectonic_movement[self._tectonic_map].T
+        moved_points = np.column_stack(
+            self._haversine_move(
+                self._points[:, 0], self._points[:, 1], bearing, distance
             )
-            for point2 in nearest_points:
-                x1, y1 = point
-                x2, y2 = point2
-                if (x1, y1) == (x2, y2):
-                    continue
-                point_key_2 = tuple(point2.tolist())
-                tectonic_index_2 = self._height_map[point_key_2]
-                if tectonic_index == tectonic_index_2:
-                    continue
-                self._borders.append(point_key)
-
-    def _generate_heat_map(self):
-        start_time = time.time()
-
-        self._generate_heat_noise()
-        self._add_latitude_delta_to_heat_map()
-        self._add_height_delta_to_heat_map()
-
-        logging.info(f"Генерация карты тепла: {time.time() - start_time:.2f}с")
-
-    def _generate_heat_noise(self):
-        heat_data = self.data["generation"]["temperature"]
-
-        # генерируем шум
-        noise_map = self._generate_perlin_noise(
-            heat_data["heat_noise_octaves"],
-            heat_data["heat_noise_coefficients"],
         )
 
-        # нормализуем шум
-        noise_map = self._normalize_map_by_min_max(
-            noise_map, heat_data["min_heat_noise"], heat_data["max_heat_noise"]
-        )
-
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            self._heat_map[point_key] = noise_map[point_key]
+        conflict_height_delta = np.zeros(len(self._points), dtype=np.float64)
+        for point_ids_1, point_ids_2 in self._find_point_id_pairs_by_distance(
+            mountain_width
+        ):
+            tectonic_indices_1 = self._tectonic_map[point_ids_1]
+            tectonic_indices_2 = self._tectonic_map[point_ids_2]
+            different_plates = tectonic_indices_1 != tectonic_indices_2
+            point_ids_1 = point_ids_1[different_plates]
+            point_ids_2 = point_ids_2[different_plates]
+            tectonic_indices_1 = tectonic_indices_1[different_plates]
+            tectonic_indices_2 = tectonic_indices_2[different_plates]
+
+            # вычисляем конфликт векторов AB и CD для всех пар сразу
+            conflict = self._calculate_vector_conflict(
+                self._points[point_ids_1].T,
+                moved_points[point_ids_1].T,
+                self._points[point_ids_2].T,
+                moved_points[point_ids_2].T,
+            )
 
-    def _add_latitude_delta_to_heat_map(self):
-        heat_data = self.data["generation"]["temperature"]
-        for point in self._points:
-            # вычисление температуры от -1 до 1 по косинусу + смещение от чатагпт
-            point_key = tuple(point.tolist())
-            lat, lon = point
-            x = np.cos(lat) * np.cos(lon)
-            y = np.cos(lat) * np.sin(lon)
-            z = np.sin(lat)
-            y1 = (
-                np.sin(heat_data["heat_rotation_angle"]) * x
-                + np.cos(heat_data["heat_rotation_angle"]) * y
+            k = np.where(
+                is_oceanic[tectonic_indices_1] & is_oceanic[tectonic_indices_2],
+                height_data["oceanic_tectonic_conflict_coefficient"],
+                height_data["tectonic_conflict_coefficient"],
             )
-            z1 = z
-            z2 = (
-                np.sin(heat_data["heat_tilt_angle"]) * y1
-                + np.cos(heat_data["heat_tilt_angle"]) * z1
+            conflict_height_delta += np.bincount(
+                point_ids_1,
+                weights=conflict / (2 * height_data["max_tectonic_speed"]) * k,
+                minlength=len(self._points),
             )
-            effective_lat = np.arcsin(z2)
-            self._heat_map[point_key] += np.cos(effective_lat) + heat_data["heat_delta"]
-        self._heat_map = self._normalize_map_by_min_max(
-            self._heat_map, heat_data["min_temp"], heat_data["max_temp"]
-        )
+        self._height_map += conflict_height_delta
 
-    def _add_height_delta_to_heat_map(self):
+    def _draw_tectonic_borders(self):
+        borders = [np.empty(0, dtype=np.intp)]
+        for point_ids_1, point_ids_2 in self._find_point_id_pairs_by_distance(
+            1.1 / self._radius
+        ):
+            different = self._height_map[point_ids_1] != self._height_map[point_ids_2]
+            borders.append(point_ids_1[different])
+        self._borders = np.unique(np.concatenate(borders)).tolist()
+
+    def _generate_heat_map(self, pool: StagePool) -> Future:
         heat_data = self.data["generation"]["temperature"]
-        water_level = self.data["generation"]["water_level"]
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            height = self._height_map[point_key]
-            if height > water_level:
-                self._heat_map[point_key] -= (height - water_level) * heat_data[
-                    "altitude_heat_k"
-                ]
-
-        self._heat_map = self._normalize_map_by_min_max(
-            self._heat_map, heat_data["min_temp"], heat_data["max_temp"]
+        return pool.submit(
+            self._calculate_heat_map,
+            self._generate_perlin_noise(
+                heat_data["heat_noise_octaves"],
+                heat_data["heat_noise_coefficients"],
+            ),
+            self._get_effective_latitudes(
+                heat_data["heat_tilt_angle"], heat_data["heat_rotation_angle"]
+            ),
+            self._height_map,
+            self.data["generation"]["water_level"],
+            heat_data,
+            self._heat_ranges,
         )
 
-    def _generate_precipitation_map(self):
-        start_time = time.time()
-
-        self._generate_precipitation_noise()
-        self._add_latitude_delta_to_precipitation_map()
-        self._add_height_delta_to_precipitation_map()
+    def _generate_precipitation_map(self, pool: StagePool) -> Future:
+        precipitation_data = self.data["generation"]["precipitation"]
+        return pool.submit(
+            self._calculate_precipitation_map,
+            self._generate_perlin_noise(
+                precipitation_data["precipitation_noise_octaves"],
+                precipitation_data["precipitation_noise_coefficients"],
+            ),
+            self._get_effective_latitudes(
+                precipitation_data["precipitation_tilt_angle"],
+                precipitation_data["precipitation_rotation_angle"],
+            ),
+            self._height_map,
+            self.data["generation"]["water_level"],
+            precipitation_data,
+            self._precipitation_ranges,
+        )
 
-        logging.info(f"Генерация карты осадков: {time.time() - start_time:.2f}с")
+    @staticmethod
+    def _calculate_heat_map(
+        noise_map, effective_lat, height_map, water_level, heat_data, ranges=None
+    ):
+        """Returns:
+        Карту температуры и диапазоны карт до нормализации: ranges или,
+        если ranges - None, диапазоны самих карт."""
+        ranges = [] if ranges is None else ranges.tolist()
+        # нормализуем шум
+        heat_map = Planet._normalize_map_by_ranges(
+            noise_map, heat_data["min_heat_noise"], heat_data["max_heat_noise"], ranges, 0
+        )
 
-    def _generate_precipitation_noise(self):
-        precipitation_data = self.data["generation"]["precipitation"]
+        # вычисление температуры от -1 до 1 по косинусу + смещение
+        heat_map += np.cos(effective_lat) + heat_data["heat_delta"]
+        heat_map = Planet._normalize_map_by_ranges(
+            heat_map, heat_data["min_temp"], heat_data["max_temp"], ranges, 1
+        )
 
-        # генерируем шум
-        noise_map = self._generate_perlin_noise(
-            precipitation_data["precipitation_noise_octaves"],
-            precipitation_data["precipitation_noise_coefficients"],
+        # на высоте холоднее
+        ground = height_map > water_level
+        heat_map[ground] -= (height_map[ground] - water_level) * heat_data[
+            "altitude_heat_k"
+        ]
+        heat_map = Planet._normalize_map_by_ranges(
+            heat_map, heat_data["min_temp"], heat_data["max_temp"], ranges, 2
         )
+        return heat_map, np.array(ranges)
 
+    @staticmethod
+    def _calculate_precipitation_map(
+        noise_map, effective_lat, height_map, water_level, precipitation_data, ranges=None
+    ):
+        """Returns:
+        Карту осадков и диапазоны карт до нормализации, как _calculate_heat_map."""
+        ranges = [] if ranges is None else ranges.tolist()
         # нормализуем шум
-        noise_map = self._normalize_map_by_min_max(
+        precipitation_map = Planet._normalize_map_by_ranges(
             noise_map,
             precipitation_data["min_precipitation_noise"],
             precipitation_data["max_precipitation_noise"],
+            ranges,
+            0,
         )
 
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            self._precipitation_map[point_key] = noise_map[point_key]
-
-    def _add_latitude_delta_to_precipitation_map(self):
-        precipitation_data = self.data["generation"]["precipitation"]
-        for point in self._points:
-            # вычисление осадков от -1 до 1 по косинусу ((4x + пи)/2) в квадрате + вращение от чатагпт
-            point_key = tuple(point.tolist())
-            lat, lon = point
-            x = np.cos(lat) * np.cos(lon)
-            y = np.cos(lat) * np.sin(lon)
-            z = np.sin(lat)
-            y1 = (
-                np.sin(precipitation_data["precipitation_rotation_angle"]) * x
-                + np.cos(precipitation_data["precipitation_rotation_angle"]) * y
-            )
-            z1 = z
-            z2 = (
-                np.sin(precipitation_data["precipitation_tilt_angle"]) * y1
-                + np.cos(precipitation_data["precipitation_tilt_angle"]) * z1
-            )
-            effective_lat = np.arcsin(z2)
-            self._precipitation_map[point_key] += (
-                np.cos((4 * effective_lat + np.pi) / 2) ** 2
-                + precipitation_data["precipitation_delta"]
-            )
-        self._precipitation_map = self._normalize_map_by_min_max(
-            self._precipitation_map,
+        # вычисление осадков от -1 до 1 по косинусу ((4x + пи)/2) в квадрате + вращение
+        precipitation_map += (
+            np.cos((4 * effective_lat + np.pi) / 2) ** 2
+            + precipitation_data["precipitation_delta"]
+        )
+        precipitation_map = Planet._normalize_map_by_ranges(
+            precipitation_map,
             precipitation_data["min_precipitation"],
             precipitation_data["max_precipitation"],
+            ranges,
+            1,
         )
 
-    def _add_height_delta_to_precipitation_map(self):
-        precipitation_data = self.data["generation"]["precipitation"]
-        water_level = self.data["generation"]["water_level"]
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            height = self._height_map[point_key]
-            if (
-                water_level
-                < height
-                < water_level + precipitation_data["precipitation_increase_level"]
-            ):
-                self._precipitation_map[point_key] += precipitation_data[
-                    "water_precipitation_increase"
-                ]
-            elif height > water_level:
-                self._precipitation_map[point_key] += (
-                    height - water_level
-                ) * precipitation_data["altitude_precipitation_k"]
-        self._precipitation_map = self._normalize_map_by_min_max(
-            self._precipitation_map,
+        # у побережья и на высоте больше осадков
+        coast = (water_level < height_map) & (
+            height_map < water_level + precipitation_data["precipitation_increase_level"]
+        )
+        highland = (height_map > water_level) & ~coast
+        precipitation_map[coast] += precipitation_data["water_precipitation_increase"]
+        precipitation_map[highland] += (
+            height_map[highland] - water_level
+        ) * precipitation_data["altitude_precipitation_k"]
+        precipitation_map = Planet._normalize_map_by_ranges(
+            precipitation_map,
             precipitation_data["min_precipitation"],
             precipitation_data["max_precipitation"],
+            ranges,
+            2,
+        )
+        return precipitation_map, np.array(ranges)
+
+    def _get_effective_latitudes(self, tilt_angle: float, rotation_angle: float):
+        """Широты всех точек после поворота на rotation_angle вокруг оси z
+        и наклона на tilt_angle. Кэшируется для каждой пары углов."""
+        key = (tilt_angle, rotation_angle)
+        if key not in self._effective_latitudes:
+            x, y, z = self._cartesian_points.T
+            y1 = np.sin(rotation_angle) * x + np.cos(rotation_angle) * y
+            z2 = np.sin(tilt_angle) * y1 + np.cos(tilt_angle) * z
+            self._effective_latitudes[key] = np.arcsin(z2)
+        return self._effective_latitudes[key]
+
+    def _generate_perlin_noise(self, octaves: list[int], coefficients: list[float]):
+        """Шум по всем точкам планеты. Октавы кэшируются в self._octave_noise,
+        поэтому поля с одинаковыми октавами не пересчитывают шум."""
+        return layered_pnoise3(
+            self._cartesian_points, octaves, coefficients, self._octave_noise
         )
 
-    @staticmethod
-    def _generate_perlin_noise_static(
-        points, octaves: list[float], coefficients: list[float]
-    ):
-        noise_map = {}
+    def _generate_neighbor_graph(self) -> None:
+        """Строит граф соседей каждой точки на расстоянии шага (включая саму точку),
+        чтобы при ходьбе не искать соседей в дереве"""
+        point_ids = np.arange(len(self._points))
+        rows = [point_ids]
+        columns = [point_ids]
+        for point_ids_1, point_ids_2 in self._find_point_id_pairs_by_distance(
+            self._walking_distance
+        ):
+            rows.append(point_ids_1)
+            columns.append(point_ids_2)
+        rows = np.concatenate(rows)
+        columns = np.concatenate(columns)
+
+        order = np.lexsort((columns, rows))
+        self._neighbor_point_ids = columns[order].astype(np.int32)
+        self._neighbor_offsets = np.zeros(len(self._points) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(rows, minlength=len(self._points)), out=self._neighbor_offsets[1:]
+        )
+
+    def _get_neighbor_point_ids(self, point_id: int) -> np.ndarray:
+        start, end = self._neighbor_offsets[point_id : point_id + 2]
+        return self._neighbor_point_ids[start:end]
 
-        for point in points:
-            lat, lon = point
-            x, y, z = Planet._spherical_to_cartesian(lat, lon)
+    @staticmethod
+    def _get_travel_costs(biome_map: np.ndarray) -> np.ndarray:
+        """Стоимость единицы расстояния (в радианах) на каждой точке по её биому"""
+        biome_costs = np.array([BIOME_TRAVEL_COSTS.get(biome, 1) for biome in BIOMES])
+        return biome_costs[biome_map].astype(np.float64)
 
-            noise_value = 0
+    def _get_edge_weights(
+        self,
+        points: np.ndarray,
+        height_map: np.ndarray,
+        biome_map: np.ndarray,
+        rows: np.ndarray,
+        columns: np.ndarray,
+    ) -> np.ndarray:
+        """Стоимости рёбер из точек с номерами rows в точки с номерами columns:
+        расстояние, умноженное на среднюю стоимость биомов концов ребра
+        и добавку за подъём"""
+        vectors = to_unit_vectors(points)
+        distances = np.arccos(
+            np.clip(np.einsum("ij,ij->i", vectors[rows], vectors[columns]), -1, 1)
+        )
 
-            for octave, k in zip(octaves, coefficients):
-                noise_value += k * noise.pnoise3(x, y, z, octaves=octave)
+        water_level = self.data["generation"]["water_level"]
+        mountain_height = self.data["generation"]["mountain_height"]
+        # под водой подъёма нет
+        heights = np.maximum(height_map, water_level)
+        rise = np.maximum(heights[columns] - heights[rows], 0)
+        rise /= mountain_height - water_level
+
+        travel_costs = self._get_travel_costs(biome_map)
+        return distances * (
+            (travel_costs[rows] + travel_costs[columns]) / 2 + CLIMB_TRAVEL_COST * rise
+        )
 
-            point_key = tuple(point.tolist())
-            noise_map[point_key] = noise_value
+    def _generate_path_finder(self) -> PathFinder:
+        """Взвешивает рёбра графа соседей через _get_edge_weights"""
+        rows = np.repeat(np.arange(len(self._points)), np.diff(self._neighbor_offsets))
+        weights = self._get_edge_weights(
+            self._points,
+            self._get_layer("height_map"),
+            self._biome_map,
+            rows,
+            self._neighbor_point_ids,
+        )
+        return PathFinder(self._neighbor_offsets, self._neighbor_point_ids, weights)
 
-        return noise_map
+    @property
+    def _biomes(self) -> BiomeIndex:
+        if self._biome_index is None:
+            self._biome_index = BiomeIndex(self._biome_map, len(BIOMES))
+        return self._biome_index
 
-    def _generate_perlin_noise(self, octaves: list[float], coefficients: list[float]):
-        return self._generate_perlin_noise_static(self._points, octaves, coefficients)
+    @property
+    def _paths(self) -> PathFinder:
+        if self._path_finder is None:
+            self._path_finder = self._generate_path_finder()
+        return self._path_finder
 
     def _generate_biome_map(self, *_):
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            height = self._height_map[point_key]
-            temperature = self._heat_map[point_key]
-            precipitation = self._precipitation_map[point_key]
-            biome = self._generate_biome(height, temperature, precipitation)
-            self._biome_map[point_key] = biome
-
-    def _generate_biome(self, height, temperature, precipitation):
         water_level = self.data["generation"]["water_level"]
         mountain_height = self.data["generation"]["mountain_height"]
-        if height < water_level:
-            if temperature < -60:
-                return "glacier"
-            return "marine"
-        if height > mountain_height:
-            if temperature < -60:
-                return "snowy_mountain"
-            return "mountain"
+        height = self._height_map
+        temperature = self._heat_map
+        precipitation = self._precipitation_map
+
+        height_class = (height >= water_level) * (1 + (height > mountain_height))
+        frozen = (temperature < -60).astype(np.intp)
 
         # expecting values from -100 to 100
         # magic numbers warning (0-20 - horizontal, 0-10 - vertical in temperature-precipitation table)
-        horizontal_index = int((temperature + 100) // 10)
-        if horizontal_index > 19:
-            horizontal_index = 19
-        elif horizontal_index < 0:
-            horizontal_index = 0
+        horizontal_index = np.clip((temperature + 100) // 10, 0, 19).astype(np.intp)
+        vertical_index = np.clip(precipitation // 10, 0, 9).astype(np.intp)
 
-        vertical_index = int(precipitation // 10)
-        if vertical_index >= 10:
-            vertical_index = 9
-        elif vertical_index < 0:
-            vertical_index = 0
-
-        return self._biome_table[vertical_index][horizontal_index]
+        self._biome_map = self._biome_lookup[
+            height_class, frozen, vertical_index, horizontal_index
+        ]
 
     def generate_colors_by_map(self, point_map):
-        colors = {}
+        """Возвращает массив цветов (N, 3), выровненный по self._points"""
         point_map = self._normalize_map_by_min_max(point_map, 0, 1)
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            c = round(point_map[point_key] * 255)
-            colors[point_key] = (c, c, c)
-        return colors
+        c = np.round(point_map * 255)
+        return np.column_stack((c, c, c))
 
     def generate_colors_by_height_map(self, height_map):
-        colors = {}
         height_map = self._normalize_map_by_min_max(height_map, 0, 1)
         threshold = np.percentile(
-            np.array(list(height_map.values())),
+            height_map,
             self.data["generation"]["height"]["water_percentage"],
         )
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            height = height_map[point_key]
-            if height > threshold:
-                color = (height * 255, height * 255, height * 255)
-            else:
-                color = (0, 0, 230)
-            if point_key in self._borders:
-                color = (color[0] / 2, color[1] / 2, color[2] / 2)
-            colors[point_key] = color
+        colors = np.column_stack((height_map, height_map, height_map)) * 255
+        colors[height_map <= threshold] = (0, 0, 230)
+        colors[self._borders] /= 2
         return colors
 
     def generate_colors_by_tectonic(self, tectonics, tectonic_colors):
-        colors = {}
-        for point in self._points:
-            point_key = tuple(point.tolist())
-            if point_key in tectonics:
-                index = tectonics[point_key]
+        colors = []
+        for index in tectonics:
+            if index >= 0:
                 color = tectonic_colors[index]
                 if index >= 8:
                     r, g, b = color
                     color = (r // 2), (g // 2), (b // 2)
             else:
                 color = (0, 0, 0)
-            colors[point_key] = color
-        return colors
+            colors.append(color)
+        return np.array(colors)
 
     def generate_colors_by_biomes(self):
-        biome_hsv = {
-            "marine": (210, 90, 70),
-            "desert": (45, 85, 90),
-            "savanna": (65, 85, 80),
-            "polar": (190, 0, 100),
-            "tundra": (200, 50, 85),
-            "taiga": (150, 70, 60),
-            "plains": (85, 75, 75),
-            "seasonal_forest": (100, 80, 70),
-            "temperate_rainforest": (120, 90, 80),
-            "swamp": (100, 60, 60),
-            "steppe": (70, 65, 80),
-            "tropical_desert": (37, 80, 90),
-            "tropical_seasonal_forest": (110, 85, 75),
-            "tropical_rainforest": (140, 95, 60),
-            "glacier": (190, 15, 85),
-            "mountain": (0, 0, 75),
-            "snowy_mountain": (0, 0, 95),
-        }
-        biome_colors = {
-            None: (255, 255, 255),
-        }
-        colors = {}
-        for point_key in self._biome_map:
-            biome = self._biome_map[point_key]
-            if biome not in biome_hsv:
-                colors[point_key] = biome_colors[biome]
-                continue
-            hue, saturation, value = biome_hsv[biome]
-            r, g, b = colorsys.hsv_to_rgb(hue / 360, saturation / 100, value / 100)
-            if point_key in self._borders:
-                r /= 3
-                g /= 3
-                b /= 3
-            color = int(r * 255), int(g * 255), int(b * 255)
-            colors[point_key] = color
-        return colors
+        colors = biome_palette(BIOMES)[self._biome_map]
+        colors[self._borders] /= 3
+        return (colors * 255).astype(int)
 
     def generate_character(
         self,
@@ -759,19 +1315,45 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
         character_data["location_id"] = self._generate_character_location_id(gen)
 
     def _generate_character_location_id(self, gen: dict):
+        point_id = self._generate_character_point_id(gen)
+        if point_id is None:
+            return 0
+        return self._get_location_ids([point_id])[0]
+
+    def _generate_character_point_id(self, gen: dict) -> int | None:
         if "coords" in gen:
             lat, lon = gen["coords"]
-            point_key = tuple(self._find_nearest_point(lat, lon).tolist())
-            return self._location_map[point_key]
+            return self._find_nearest_point_index(lat, lon)
         if "biome" in gen:
-            char_biome = gen["biome"]
-            random_points = random.shuffle(self._point_map.tolist())
-            for point in random_points:
-                point_key = tuple(point.tolist())
-                biome = self._biome_map[point_key]
-                if biome == char_biome:
-                    return self._location_map[point_key]
-        return 0
+            return self._biomes.sample(self._get_biome_weights(gen["biome"]))
+        return None
+
+    @staticmethod
+    def _get_biome_weights(
+        biomes: str | list[str] | dict[str, float],
+    ) -> dict[int, float]:
+        """Биом, список равновероятных биомов или словарь биом -> вес одной локации
+        в словарь id биома -> вес"""
+        if isinstance(biomes, str):
+            biomes = [biomes]
+        if not isinstance(biomes, dict):
+            biomes = dict.fromkeys(biomes, 1)
+        return {BIOME_IDS[biome]: weight for biome, weight in biomes.items()}
+
+    def sample_location_ids(
+        self, biomes: str | list[str] | dict[str, float], number: int
+    ) -> list[int]:
+        """id number случайных локаций (с повторами) биомов biomes -
+        для массового появления персонажей.
+
+        Args:
+            biomes: Биом, список биомов или словарь биом -> вес одной его локации.
+            number: Сколько локаций выбрать.
+        """
+        point_ids = self._biomes.sample(self._get_biome_weights(biomes), number)
+        if point_ids is None:
+            return []
+        return self._get_location_ids(point_ids)
 
     # endregion Методы генерации
 
@@ -784,49 +1366,56 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
         c: tuple[float, float],
         d: tuple[float, float],
     ) -> float:
+        """Точки задаются парами (lat, lon), где lat и lon - числа или массивы"""
         d_ab = Planet._haversine_distance(a[0], a[1], b[0], b[1])
         d_ac = Planet._haversine_distance(a[0], a[1], c[0], c[1])
         d_bc = Planet._haversine_distance(b[0], b[1], c[0], c[1])
-
-        denom_a = np.sin(d_ac) * np.sin(d_ab)
-        if abs(denom_a) < 1e-10:
-            angle_a = 0.0
-        else:
-            val_a = (np.cos(d_bc) - np.cos(d_ac) * np.cos(d_ab)) / denom_a
-            val_a = max(min(val_a, 1), -1)
-            angle_a = np.acos(val_a)
+        angle_a = Planet._spherical_angle(d_ac, d_ab, d_bc)
 
         d_cd = Planet._haversine_distance(c[0], c[1], d[0], d[1])
         d_ad = Planet._haversine_distance(a[0], a[1], d[0], d[1])
-
-        denom_c = np.sin(d_ac) * np.sin(d_cd)
-        if abs(denom_c) < 1e-10:
-            angle_c = 0.0
-        else:
-            val_c = (np.cos(d_ad) - np.cos(d_ac) * np.cos(d_cd)) / denom_c
-            val_c = max(min(val_c, 1), -1)
-            angle_c = np.acos(val_c)
+        angle_c = Planet._spherical_angle(d_ac, d_cd, d_ad)
 
         return np.cos(angle_a) * d_ab + np.cos(angle_c) * d_cd
 
     @staticmethod
-    def _normalize_map_by_min_max(point_map, min_value: float, max_value: float):
+    def _spherical_angle(side1, side2, opposite_side):
+        """Угол между сторонами side1 и side2 сферического треугольника.
+        Для вырожденных треугольников возвращает 0."""
+        denom = np.sin(side1) * np.sin(side2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            value = (np.cos(opposite_side) - np.cos(side1) * np.cos(side2)) / denom
+        return np.where(np.abs(denom) < 1e-10, 0.0, np.arccos(np.clip(value, -1, 1)))
+
+    @staticmethod
+    def _normalize_map_by_min_max(
+        point_map, min_value: float, max_value: float, source_range=None
+    ):
         k = max_value - min_value
         d = (min_value + max_value) / k
-        return Planet._normalize_map(point_map, k, d)
+        return Planet._normalize_map(point_map, k, d, source_range)
+
+    @staticmethod
+    def _normalize_map_by_ranges(
+        point_map, min_value: float, max_value: float, ranges: list, index: int
+    ):
+        """Нормализует карту, считая её исходным диапазоном ranges[index].
+        Если диапазона ещё нет, добавляет в ranges диапазон самой карты."""
+        if index == len(ranges):
+            ranges.append((point_map.min(), point_map.max()))
+        return Planet._normalize_map_by_min_max(
+            point_map, min_value, max_value, ranges[index]
+        )
 
     @staticmethod
-    def _normalize_map(point_map, k: float = 0, d: float = 0):
-        new_point_map = {}
-        min_value = min(point_map.values())
-        for i in point_map:
-            new_point_map[i] = point_map[i] - min_value
-        max_value = max(new_point_map.values())
+    def _normalize_map(point_map, k: float = 0, d: float = 0, source_range=None):
+        """source_range - (минимум, максимум) карты, по умолчанию - её собственные"""
+        source_min, source_max = source_range or (point_map.min(), point_map.max())
+        new_point_map = point_map - source_min
+        max_value = source_max - source_min
         if k:
-            for i in point_map:
-                new_point_map[i] *= k / max_value
-        for i in point_map:
-            new_point_map[i] += k / 2 * (d - 1)
+            new_point_map *= k / max_value
+        new_point_map += k / 2 * (d - 1)
         return new_point_map
 
     @staticmethod
@@ -846,27 +1435,31 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
         return lat, lon
 
     @staticmethod
-    def _relaxate_points(points, iterations=100, step_size=0.01, min_dist=1e-6):
-        n = points.shape[0]
+    def _relaxate_points(
+        points, iterations=100, step_size=0.01, min_dist=1e-6, tolerance=1e-9
+    ):
+        """Расталкивает точки по сфере. Останавливается раньше iterations,
+        если за итерацию ни одна точка не сдвинулась больше чем на tolerance."""
         # Convert all points to Cartesian coordinates
-        coords = np.array(
-            [Planet._spherical_to_cartesian(lat, lon) for lat, lon in points]
-        )
+        coords = Planet._spherical_to_cartesian(points[:, 0], points[:, 1]).T
 
         # Iteratively adjust points by repulsion forces
         for _ in range(iterations):
-            forces = np.zeros_like(coords)
-            # Compute repulsive forces between all pairs of points
-            for i in range(n):
-                for j in range(n):
-                    if i != j:
-                        diff = coords[i] - coords[j]
-                        dist = np.linalg.norm(diff) + min_dist
-                        forces[i] += diff / (dist**3)
-            coords = coords + step_size * forces
-            coords = np.array([v / np.linalg.norm(v) for v in coords])
-
-        return np.array([Planet._cartesian_to_spherical(v) for v in coords])
+            # Compute repulsive forces between all pairs of points at once:
+            # sum_j (c_i - c_j) * w_ij = c_i * sum_j w_ij - (W @ C)_i
+            squared_dist = np.maximum(2 - 2 * coords @ coords.T, 0)
+            weights = (np.sqrt(squared_dist) + min_dist) ** -3
+            np.fill_diagonal(weights, 0)
+            forces = coords * weights.sum(axis=1)[:, np.newaxis] - weights @ coords
+            new_coords = coords + step_size * forces
+            new_coords /= np.linalg.norm(new_coords, axis=1)[:, np.newaxis]
+
+            movement = np.linalg.norm(new_coords - coords, axis=1).max()
+            coords = new_coords
+            if movement < tolerance:
+                break
+
+        return np.column_stack(Planet._cartesian_to_spherical(coords.T))
 
     @staticmethod
     def _haversine_distance(lat1, lon1, lat2, lon2):
@@ -890,40 +1483,52 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
         )
         return new_lat, new_lon
 
-    def _find_nearest_points_by_distance(
+    @property
+    def _index(self) -> SphereIndex:
+        if self._sphere_index is None:
+            self._sphere_index = SphereIndex(self._points)
+        return self._sphere_index
+
+    def _find_nearest_point_ids_by_distance(
         self,
         latitude,
         longitude,
         max_distance,  # в радианах
     ):
-        query_point = np.array([[latitude, longitude]])
-        indices = self._tree.query_radius(query_point, r=max_distance)[0]
-        return self._points[indices]
+        return self._index.within_radius([[latitude, longitude]], max_distance)[0]
+
+    def _find_point_id_pairs_by_distance(self, max_distance, chunk_size=2**16):
+        """Перебирает пары разных соседних точек не дальше max_distance (в радианах).
+
+        Соседи ищутся одним запросом на каждые chunk_size точек.
+        Все пары одной точки приходят в одной порции, по порядку её точек.
+
+        Yields:
+            Массивы point_ids_1 и point_ids_2 одинаковой длины.
+        """
+        for start in range(0, len(self._points), chunk_size):
+            end = min(start + chunk_size, len(self._points))
+            point_ids_1, point_ids_2 = self._index.within_radius_pairs(
+                self._points[start:end], max_distance
+            )
+            point_ids_1 += start
+            different_points = point_ids_1 != point_ids_2
+            yield point_ids_1[different_points], point_ids_2[different_points]
 
     def _move_and_find_next_point(
         self, latitude, longitude, bearing, distance
     ):  # distance in radians
         lat2, lon2 = self._haversine_move(latitude, longitude, bearing, distance)
 
-        query_point = [[lat2, lon2]]
-        _, indices = self._tree.query(query_point, k=2)  # Get two closest points
+        _, indices = self._index.k_nearest([[lat2, lon2]], k=2)  # Get two closest points
         if indices[0][0] == self._find_nearest_point_index(latitude, longitude):
             return self._points[
                 indices[0][1]
             ]  # Return second closest if first is the original point
         return self._points[indices[0][0]]
 
-    @staticmethod
-    def _find_nearest_points_index_static(
-        latitude: float, longitude: float, tree: BallTree, k=1
-    ) -> int:
-        query_point = [[latitude, longitude]]
-        return tree.query(query_point, k=k, return_distance=False)[0]
-
     def _find_nearest_point_index(self, latitude: float, longitude: float) -> int:
-        return self._find_nearest_points_index_static(
-            latitude, longitude, self._tree, k=1
-        )[0]
+        return int(self._index.nearest([[latitude, longitude]])[1][0])
 
     def _find_nearest_point(self, latitude: float, longitude: float):
         return self._points[self._find_nearest_point_index(latitude, longitude)]
@@ -951,14 +1556,12 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
 
     # region Отображение
 
-    def _find_accessible_location_ids(
-        self, location_id: int, distance: float
-    ) -> list[int]:
-        point_key = self._point_map[location_id]
-        accessible_points = self._find_nearest_points_by_distance(
-            point_key[0], point_key[1], distance
+    def _find_accessible_location_ids(self, location_id: int) -> list[int]:
+        """Локации на расстоянии шага, включая саму локацию"""
+        accessible_point_ids = self._get_neighbor_point_ids(
+            self._get_point_id(location_id)
         )
-        return [self._location_map[tuple(point.tolist())] for point in accessible_points]
+        return self._get_location_ids(accessible_point_ids)
 
     def _get_accessible_location_description(
         self,
@@ -966,11 +1569,13 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
         accessible_location: Location,
         location_number: int,
     ) -> str:
-        point1 = self._point_map[location.get_id()]
-        point2 = self._point_map[accessible_location.get_id()]
-        direction = self._get_direction(point1, point2)
+        point_id_1 = self._get_point_id(location.get_id())
+        point_id_2 = self._get_point_id(accessible_location.get_id())
+        direction = self._get_direction(
+            self._get_point(point_id_1), self._get_point(point_id_2)
+        )
         compass = self._direction_to_compass(direction)
-        biome_name = BIOME_NAMES[accessible_location.get_data("biome")]
+        biome_name = BIOME_NAMES[self._get_biome(point_id_2)]
         return f"Loc_{location_number}: {biome_name}, {compass}."
 
     def get_character_description(self, character: Character, ns: "Neurosphere") -> str:
@@ -984,9 +1589,10 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
     def get_location_description(self, character: Character, ns: "Neurosphere") -> str:
         output = ""
         location = ns.get_location_by_character(character)
-        biome_name = BIOME_NAMES[location.get_data("biome")]
+        point_id = self._get_point_id(location.get_id())
+        biome_name = BIOME_NAMES[self._get_biome(point_id)]
         output += f"Biome: {biome_name}\n"
-        lat, lon = self._point_map[location.get_id()]
+        lat, lon = self._get_point(point_id)
         output += (
             f"Latitude: {np.rad2deg(lat):.2f}, longitude: {np.rad2deg(lon - np.pi):.2f}\n"
         )
@@ -1006,10 +1612,7 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
         ns: "Neurosphere",
     ) -> dict[int, str]:
         location = ns.get_location_by_character(character)
-        accessible_location_ids = self._find_accessible_location_ids(
-            location.get_id(),
-            self._walking_distance,
-        )
+        accessible_location_ids = self._find_accessible_location_ids(location.get_id())
         accessible_location_ids.sort()
         accessible_locations = [
             ns.locations[location_id] for location_id in accessible_location_ids
@@ -1023,15 +1626,470 @@ polar	tundra	tundra	tundra	taiga	taiga	plains	steppe	steppe	steppe	steppe	steppe
             for location_number, accessible_location in enumerate(accessible_locations)
         }
 
+    def _get_layer_colors(self, layer: str) -> np.ndarray:
+        """Цвета (N, 3) uint8 точек на карте слоя layer, выровненные по self._points"""
+        generation = self.data["generation"]
+        if layer == "biome":
+            return (biome_palette(BIOMES)[self._biome_map] * 255).astype(np.uint8)
+        if layer == "height":
+            height_data = generation["height"]
+            water_level = generation["water_level"]
+            height_map = self._get_layer("height_map")
+            colors = apply_gradient(
+                height_map, water_level, height_data["max_height"], LAND_GRADIENT
+            )
+            water = height_map < water_level
+            colors[water] = apply_gradient(
+                height_map[water],
+                height_data["min_height"],
+                water_level,
+                WATER_GRADIENT,
+            )
+            return colors
+        if layer == "heat":
+            heat_data = generation["temperature"]
+            return apply_gradient(
+                self._get_layer("heat_map"),
+                heat_data["min_temp"],
+                heat_data["max_temp"],
+                HEAT_GRADIENT,
+            )
+        if layer == "precipitation":
+            precipitation_data = generation["precipitation"]
+            return apply_gradient(
+                self._get_layer("precipitation_map"),
+                precipitation_data["min_precipitation"],
+                precipitation_data["max_precipitation"],
+                PRECIPITATION_GRADIENT,
+            )
+        raise ValueError(f"Unknown map layer: {layer}")
+
+    def render_map(self, layer: str, width: int = MAP_WIDTH) -> str:
+        """Путь к PNG карте слоя layer. Карта рисуется один раз,
+        потом берётся из кэша генерации."""
+        if layer not in LAYERS:
+            raise ValueError(f"Unknown map layer: {layer}")
+        description = {
+            "generation": self.data["generation"],
+            "map": layer,
+            "storage": self.data.get("stored_layers", {}),
+            "width": width,
+            "renderer": RENDERER_VERSION,
+        }
+        if layer == "biome":
+            # биомы точек могут меняться после генерации (_set_biome)
+            description["biome_map"] = hashlib.sha256(
+                np.ascontiguousarray(self._biome_map)
+            ).hexdigest()
+        key = GENERATION_CACHE.key(self.data["type"], description, GENERATOR_VERSION)
+        path = GENERATION_CACHE.get(key)
+        if path is None:
+            colors = self._get_layer_colors(layer)
+            if width not in self._map_pixel_indices:
+                self._map_pixel_indices[width] = nearest_point_indices(self._index, width)
+            indices = self._map_pixel_indices[width]
+            path = GENERATION_CACHE.put(
+                key,
+                lambda directory: write_png(
+                    os.path.join(directory, MAP_FILE_NAME), colors, indices
+                ),
+            )
+        return os.path.join(path, MAP_FILE_NAME)
+
     # endregion Отображение
 
     # region Действия
 
+    def find_route(
+        self, start_location_id: int, goal_location_id: int
+    ) -> list[int] | None:
+        """Самый дешёвый с учётом местности путь шагами между локациями.
+
+        Returns:
+            id локаций пути от начальной до конечной включительно
+            или None, если конечная недостижима.
+        """
+        path = self._paths.find_path(
+            self._get_point_id(start_location_id), self._get_point_id(goal_location_id)
+        )
+        if path is None:
+            return None
+        point_ids, _ = path
+        return self._get_location_ids(point_ids)
+
     # endregion Действия
 
     # endergion Методы нейросферы
 
 
+class TiledPlanet(Planet):
+    """Планета, которая генерируется по областям (см. regions.py), когда к ним
+    подходят персонажи. Память и время запуска зависят от исследованной площади,
+    а не от площади планеты.
+
+    generate генерирует только грубую планету радиуса не больше COARSE_RADIUS
+    с теми же параметрами. По ней считаются параметры всей планеты
+    (PLANET_PARAMETERS) и уровни воды и гор, а по ним - каждая область отдельно.
+    Области хранятся в кэше генерации, в памяти остаются MAX_LOADED_REGIONS
+    последних. Локации, как и у обычной планеты, создаются при первом обращении
+    и получают id location_id_offset + id точки.
+    """
+
+    def __init__(self, data):
+        # до super().__init__, который читает данные через _read_data
+        self._coarse: Planet | None = None
+        self._grid: RegionGrid | None = None
+        self._regions: OrderedDict[int, Region] = OrderedDict()  # region_id -> область
+        super().__init__(data)
+
+    def _read_data(self) -> None:
+        self._sphere_index = None
+        self._path_finder = None
+        if self.data.get("coarse") and "legacy_points" not in self.data:
+            # сохранения до GENERATOR_VERSION 6: точки во float32, а их id уже
+            # стали id локаций, поэтому точки считаются по-старому
+            self.data["legacy_points"] = True
+        self._grid = self._create_grid()
+        self._regions.clear()
+        if self.data.get("coarse"):
+            self._coarse = Planet(self.data["coarse"])
+
+    def _create_grid(self) -> RegionGrid:
+        return RegionGrid(
+            self._get_points_number(), legacy=self.data.get("legacy_points", False)
+        )
+
+    def write_arrays(self, directory: str) -> None:
+        # области не сохраняются: их можно сгенерировать заново или взять из кэша
+        if self._coarse is not None:
+            self._coarse.write_arrays(os.path.join(directory, "coarse"))
+
+    def to_dict(self):
+        if self._coarse is not None:
+            self._coarse.to_dict()
+        return World.to_dict(self)
+
+    def generate(self, progress: ProgressCallback | None = None) -> None:
+        """Генерирует грубую планету и параметры всей планеты.
+        Области генерируются потом, при обращении к ним."""
+        generation = self.data["generation"]
+        if generation["seed"] is None:
+            generation["seed"] = random.randint(0, 100000)
+        self._radius = generation["radius"]
+        self._walking_distance = 1.1 / self._radius
+        self._walking_speed = 0.1 / self._radius
+
+        coarse_generation = copy.deepcopy(generation)
+        coarse_generation["radius"] = min(self._radius, COARSE_RADIUS)
+        self.data["coarse"] = {
+            "id": self.data["id"],
+            "type": "planet",
+            "generation": coarse_generation,
+            "points": [],
+            "maps": {name: [] for name in self.data["maps"]},
+            "storage": self.data.get("storage", {}),
+        }
+        self._coarse = Planet(self.data["coarse"])
+        self._coarse.generate(progress)
+
+        generation["water_level"] = coarse_generation["water_level"]
+        generation["mountain_height"] = coarse_generation["mountain_height"]
+        self.data["generation_profile"] = self._coarse.data["generation_profile"]
+        self.data["storage_report"] = self._coarse.data["storage_report"]
+        self.data["legacy_points"] = False
+        self._grid = self._create_grid()
+        self._regions.clear()
+
+    def statistics(self) -> dict:
+        # статистика грубой планеты: всю планету не сгенерировать
+        return self._coarse.statistics()
+
+    def generate_locations(self, location_holder: LocationHolder) -> None:
+        # без карты локаций: на всю планету она заняла бы слишком много памяти
+        self.data["location_id_offset"] = location_holder.reserve(
+            self._get_points_number(), self._create_location
+        )
+        self._location_holder = location_holder
+
+    # region Области
+
+    def _get_point_region(self, point_id: int) -> Region:
+        points = self._grid.get_points([point_id])
+        return self._get_region(int(self._grid.get_regions(points)[0]))
+
+    def _get_region(self, region_id: int) -> Region:
+        """Область из памяти, из кэша генерации или сгенерированная заново"""
+        if region_id in self._regions:
+            self._regions.move_to_end(region_id)
+            return self._regions[region_id]
+
+        key = self._get_region_key(region_id)
+        path = GENERATION_CACHE.get(key)
+        if path is not None:
+            region = Region.read(path)
+        else:
+            region = self._generate_region(region_id)
+            GENERATION_CACHE.put(key, region.write)
+
+        self._regions[region_id] = region
+        if len(self._regions) > MAX_LOADED_REGIONS:
+            self._regions.popitem(last=False)
+        return region
+
+    def _get_region_key(self, region_id: int) -> str:
+        return GENERATION_CACHE.key(
+            self.data["type"],
+            {
+                "generation": self.data["generation"],
+                "region": region_id,
+                "legacy_points": self._grid.legacy,
+            },
+            GENERATOR_VERSION,
+        )
+
+    def _is_region_ready(self, region_id: int) -> bool:
+        """Загружена ли область или лежит ли она в кэше генерации"""
+        return (
+            region_id in self._regions
+            or GENERATION_CACHE.get(self._get_region_key(region_id)) is not None
+        )
+
+    def _generate_region(self, region_id: int) -> Region:
+        # соседей и конфликт плит у края области ищем среди точек вокруг неё
+        margin = max(
+            self.data["generation"]["height"]["mountain_width_in_units"] / self._radius,
+            self._walking_distance,
+        )
+        point_ids = self._grid.get_point_ids(region_id, margin)
+
+        planet = Planet(
+            {
+                "id": self.data["id"],
+                "type": "planet",
+                "generation": self.data["generation"],
+                "points": [],
+                "maps": {name: [] for name in self.data["maps"]},
+            }
+        )
+        for name in PLANET_PARAMETERS:
+            setattr(planet, f"_{name}", getattr(self._coarse, f"_{name}"))
+        planet._generate_region_maps(self._grid.get_points(point_ids))
+        logging.info(
+            f"Область {region_id}: {planet._profiler.report['wall_time']:.2f}с, "
+            f"{len(point_ids)} точек"
+        )
+
+        inside = self._grid.get_regions(planet._points) == region_id
+        # граф соседей только точек области, но с id точек всей планеты
+        counts = np.diff(planet._neighbor_offsets)[inside]
+        neighbor_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=neighbor_offsets[1:])
+        edges = np.repeat(
+            planet._neighbor_offsets[:-1][inside] - neighbor_offsets[:-1], counts
+        ) + np.arange(neighbor_offsets[-1])
+        return Region(
+            {
+                "point_ids": point_ids[inside],
+                "points": planet._points[inside],
+                "tectonic_map": planet._tectonic_map[inside],
+                "height_map": planet._height_map[inside],
+                "heat_map": planet._heat_map[inside],
+                "precipitation_map": planet._precipitation_map[inside],
+                "biome_map": planet._biome_map[inside],
+                "neighbor_offsets": neighbor_offsets,
+                "neighbor_point_ids": point_ids[planet._neighbor_point_ids[edges]].astype(
+                    np.int32
+                ),
+            }
+        )
+
+    def _load_regions_near(self, point_id: int) -> None:
+        """Загружает области ближе REGION_LOAD_DISTANCE к точке"""
+        latitude, longitude = self._grid.get_points([point_id])[0]
+        for region_id in self._grid.get_regions_near(
+            latitude, longitude, REGION_LOAD_DISTANCE / self._radius
+        ):
+            self._get_region(region_id)
+
+    # endregion Области
+
+    # region Точки и локации
+
+    def _get_biome(self, point_id: int) -> str:
+        region = self._get_point_region(point_id)
+        return BIOMES[region.arrays["biome_map"][region.index(point_id)]]
+
+    def _get_point(self, point_id: int) -> np.ndarray:
+        region = self._get_point_region(point_id)
+        return region.arrays["points"][region.index(point_id)]
+
+    def _get_neighbor_point_ids(self, point_id: int) -> np.ndarray:
+        return self._get_point_region(point_id).get_neighbor_point_ids(point_id)
+
+    def _find_nearest_point_index(self, latitude: float, longitude: float) -> int:
+        # начинаем с двух расстояний между соседними точками
+        distance = 2 * np.sqrt(4 * np.pi / self._grid.points_number)
+        while True:
+            point_ids, points = self._grid.get_point_ids_near(
+                latitude, longitude, distance
+            )
+            if len(point_ids):
+                distances, indices = SphereIndex(points).nearest([[latitude, longitude]])
+                if distances[0] <= distance:
+                    return int(point_ids[indices[0]])
+            distance *= 2
+
+    def sample_location_ids(
+        self, biomes: str | list[str] | dict[str, float], number: int
+    ) -> list[int]:
+        return self._get_location_ids(self._sample_point_ids(biomes, number))
+
+    def _generate_character_point_id(self, gen: dict) -> int | None:
+        if "coords" not in gen and "biome" in gen:
+            point_ids = self._sample_point_ids(gen["biome"], 1)
+            point_id = int(point_ids[0]) if len(point_ids) else None
+        else:
+            point_id = super()._generate_character_point_id(gen)
+        if point_id is not None:
+            self._load_regions_near(point_id)
+        return point_id
+
+    def _sample_point_ids(
+        self, biomes: str | list[str] | dict[str, float], number: int
+    ) -> np.ndarray:
+        """До number случайных точек (с повторами) биомов biomes.
+
+        Биомы известны только в загруженных областях, поэтому места выбираются
+        на грубой планете, а в их областях берутся ближайшие к ним точки нужного
+        биома. Генерируются не больше SPAWN_NEW_REGIONS новых областей, в которые
+        попало больше всего мест; остальные места и места, рядом с которыми нет
+        точек нужного биома, выбираются заново среди загруженных областей.
+        """
+        weights = self._get_biome_weights(biomes)
+        biome_ids = [biome_id for biome_id, weight in weights.items() if weight > 0]
+        ready = set(self._regions)
+        new_regions = SPAWN_NEW_REGIONS
+        point_ids = np.empty(0, dtype=np.int64)
+        for _ in range(SPAWN_ATTEMPTS):
+            if len(point_ids) == number:
+                break
+            if new_regions > 0:
+                coarse_point_ids = self._coarse._biomes.sample(
+                    weights, number - len(point_ids)
+                )
+            else:
+                allowed = np.isin(
+                    self._grid.get_regions(self._coarse._points), list(ready)
+                )
+                coarse_point_ids = self._coarse._biomes.sample_among(
+                    weights, number - len(point_ids), allowed
+                )
+            if coarse_point_ids is None:
+                break
+
+            points = self._coarse._points[coarse_point_ids]
+            regions = self._grid.get_regions(points)
+            new, counts = np.unique(regions, return_counts=True)
+            for region_id in new[np.argsort(-counts, kind="stable")]:
+                if region_id in ready or self._is_region_ready(int(region_id)):
+                    ready.add(region_id)
+                elif new_regions > 0:
+                    ready.add(region_id)
+                    new_regions -= 1
+            found = self._snap_to_biomes(points[np.isin(regions, list(ready))], biome_ids)
+            point_ids = np.concatenate((point_ids, found[found >= 0]))
+        return point_ids
+
+    def _snap_to_biomes(self, points: np.ndarray, biome_ids: list[int]) -> np.ndarray:
+        """Для каждого места грубой планеты - ближайшая точка биома из biome_ids
+        в областях мест или -1, если такой нет в пределах клетки грубой планеты.
+        Каждая область загружается один раз."""
+        point_ids = [np.empty(0, dtype=np.int64)]
+        allowed_points = [np.empty((0, 2))]
+        for region_id in np.unique(self._grid.get_regions(points)):
+            region = self._get_region(int(region_id))
+            allowed = np.isin(region.arrays["biome_map"], biome_ids)
+            point_ids.append(region.point_ids[allowed])
+            allowed_points.append(region.arrays["points"][allowed])
+        point_ids = np.concatenate(point_ids)
+        if not len(point_ids):
+            return np.full(len(points), -1, dtype=np.int64)
+
+        distances, indices = SphereIndex(np.concatenate(allowed_points)).nearest(points)
+        # биом точки грубой планеты - биом её клетки, так что точка нужного биома
+        # ищется не дальше расстояния между точками грубой планеты
+        cell = np.sqrt(4 * np.pi / len(self._coarse._points))
+        return np.where(distances <= cell, point_ids[indices], -1)
+
+    # endregion Точки и локации
+
+    def get_accessible_location_descriptions(
+        self,
+        character: Character,
+        ns: "Neurosphere",
+    ) -> dict[int, str]:
+        # персонаж подходит к соседним областям - загружаем их заранее
+        self._load_regions_near(self._get_point_id(character.get_location_id()))
+        return super().get_accessible_location_descriptions(character, ns)
+
+    def render_map(self, layer: str, width: int = MAP_WIDTH) -> str:
+        # карта всей планеты рисуется по грубой планете
+        return self._coarse.render_map(layer, width)
+
+    def find_route(
+        self, start_location_id: int, goal_location_id: int
+    ) -> list[int] | None:
+        """Самый дешёвый путь, как у Planet, но только по загруженным областям:
+        граф всей планеты не помещается в память. Области вокруг начала и область
+        цели загружаются, а путь через незагруженные области не ищется.
+
+        Returns:
+            id локаций пути от начальной до конечной включительно
+            или None, если по загруженным областям до конечной не дойти.
+        """
+        start = self._get_point_id(start_location_id)
+        goal = self._get_point_id(goal_location_id)
+        self._load_regions_near(start)
+        self._get_point_region(goal)
+
+        regions = list(self._regions.values())
+        point_ids = np.concatenate([region.point_ids for region in regions])
+        neighbor_point_ids = np.concatenate(
+            [region.arrays["neighbor_point_ids"] for region in regions]
+        )
+        rows = np.repeat(
+            np.arange(len(point_ids)),
+            np.concatenate(
+                [np.diff(region.arrays["neighbor_offsets"]) for region in regions]
+            ),
+        )
+        # номера соседей среди загруженных точек; рёбра в незагруженные области
+        # отбрасываются
+        order = np.argsort(point_ids)
+        positions = np.searchsorted(point_ids, neighbor_point_ids, sorter=order)
+        columns = order[np.minimum(positions, len(point_ids) - 1)]
+        loaded = point_ids[columns] == neighbor_point_ids
+        rows, columns = rows[loaded], columns[loaded]
+
+        weights = self._get_edge_weights(
+            np.concatenate([region.arrays["points"] for region in regions]),
+            np.concatenate([region.arrays["height_map"] for region in regions]),
+            np.concatenate([region.arrays["biome_map"] for region in regions]),
+            rows,
+            columns,
+        )
+        offsets = np.zeros(len(point_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(point_ids)), out=offsets[1:])
+        path = PathFinder(offsets, columns, weights).find_path(
+            int(order[np.searchsorted(point_ids, start, sorter=order)]),
+            int(order[np.searchsorted(point_ids, goal, sorter=order)]),
+        )
+        if path is None:
+            return None
+        indices, _ = path
+        return self._get_location_ids(point_ids[indices])
+
+
 # seed = 603  # архипелаг
 # seed = 5950
 # seed = 29
@@ -40,5 +40,8 @@ async def on_message(message: disnake.Message):
         logging.info(f"<!NEW DM!> {username}: {user_message}")
 
 
-load()
-bot.run(token=TOKEN)
+# процессы пула генерации миров заново импортируют этот модуль,
+# и бот должен запускаться только в главном процессе
+if __name__ == "__main__":
+    load()
+    bot.run(token=TOKEN)
@@ -1,9 +1,12 @@
+import argparse
 import logging
 
 import matplotlib.pyplot as plt
 import numpy as np
 
 from cogwheels.neurosphere import Neurosphere
+from data.neurosphere.rendering import GLOBE_SIZE, LAYERS, render_globe, write_image
+from data.neurosphere.statistics import format_statistics
 
 
 def plot_sphere_points(points, colors):
@@ -14,7 +17,8 @@ def plot_sphere_points(points, colors):
 
     Args:
         points (numpy.ndarray): Array of shape (n, 2) containing (latitude, longitude) in radians.
-        colors (dict): Dictionary mapping (latitude, longitude) tuples to RGB color tuples.
+        colors (numpy.ndarray): Array of shape (n, 3) with RGB colors from 0 to 255
+            aligned with points.
     """
     # Convert lat/lon to Cartesian coordinates on the unit sphere.
     # (latitude, longitude) where latitude is in [-pi/2, pi/2] and longitude in [-pi, pi].
@@ -22,6 +26,8 @@ def plot_sphere_points(points, colors):
     y = np.cos(points[:, 0]) * np.sin(points[:, 1])
     z = np.sin(points[:, 0])
     points_cartesian = np.stack([x, y, z], axis=1)
+    # Matplotlib expects colors from 0 to 1; convert all of them once.
+    colors = np.asarray(colors) / 255.0
 
     # Create the figure and 3D axis.
     fig = plt.figure(figsize=(10, 10))
@@ -51,59 +57,33 @@ def plot_sphere_points(points, colors):
 
     visible_border = 0
 
+    def get_visible_mask():
+        # Each sphere point is also a unit vector: if its dot product with the camera
+        # direction is positive, the point is facing the camera.
+        return points_cartesian @ get_camera_direction() > visible_border
+
     def update_visible_points(event=None):
-        # Get the current camera direction from the axis.
-        camera_dir = get_camera_direction()
-        # For each sphere point (which is also a unit vector), compute its dot product with camera_dir.
-        # If the dot is positive, the point is facing the camera.
-        dots = np.dot(points_cartesian, camera_dir)
-        visible_mask = dots > visible_border
-
-        # Filter visible points.
-        x_vis = x[visible_mask]
-        y_vis = y[visible_mask]
-        z_vis = z[visible_mask]
-
-        # Update scatter data.
-        scatter._offsets3d = (x_vis, y_vis, z_vis)
-
-        # Update colors for visible points.
-        points_vis = points[visible_mask]
-        new_color_list = []
-        for point in points_vis:
-            lat = float(point[0])
-            lon = float(point[1])
-            rgb = colors[(lat, lon)]
-            normalized_rgb = [c / 255.0 for c in rgb]
-            new_color_list.append(normalized_rgb)
-        new_color_array = np.array(new_color_list)
-        scatter.set_facecolor(new_color_array)
+        visible_mask = get_visible_mask()
+        scatter._offsets3d = (x[visible_mask], y[visible_mask], z[visible_mask])
+        scatter.set_facecolor(colors[visible_mask])
 
         # Update the title with the current count of visible points.
-        ax.set_title(f"Visible Neurosphere Points ({len(x_vis)} Points)", fontsize=14)
+        ax.set_title(
+            f"Visible Neurosphere Points ({np.count_nonzero(visible_mask)} Points)",
+            fontsize=14,
+        )
         fig.canvas.draw_idle()
 
-    # Initially compute visible points.
-    camera_dir = get_camera_direction()
-    dots = np.dot(points_cartesian, camera_dir)
-    visible_mask = dots > visible_border
-    x_vis = x[visible_mask]
-    y_vis = y[visible_mask]
-    z_vis = z[visible_mask]
-
-    # Build color array for the initially visible points.
-    color_list = []
-    points_vis = points[visible_mask]
-    for point in points_vis:
-        lat = float(point[0])
-        lon = float(point[1])
-        rgb = colors[(lat, lon)]
-        normalized_rgb = [c / 255.0 for c in rgb]
-        color_list.append(normalized_rgb)
-    color_array = np.array(color_list)
-
-    # Plot the visible points.
-    scatter = ax.scatter(x_vis, y_vis, z_vis, s=50, c=color_array, alpha=1)
+    # Plot the initially visible points.
+    visible_mask = get_visible_mask()
+    scatter = ax.scatter(
+        x[visible_mask],
+        y[visible_mask],
+        z[visible_mask],
+        s=50,
+        c=colors[visible_mask],
+        alpha=1,
+    )
 
     # Draw a wireframe sphere for context.
     u = np.linspace(0, 2 * np.pi, 30)
@@ -131,14 +111,53 @@ def plot_sphere_points(points, colors):
     return fig, ax
 
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(
+        description="Interactive viewer of a Neurosphere planet or, with --output, "
+        "a headless orthographic render of it"
+    )
+    parser.add_argument("--neurosphere", default="neurosphere0")
+    parser.add_argument("--world", type=int, default=0)
+    parser.add_argument(
+        "--layer", choices=LAYERS, help="biomes with plate borders if unset"
+    )
+    parser.add_argument("--output", help="PNG path; renders without a window")
+    parser.add_argument(
+        "--view",
+        type=float,
+        nargs=2,
+        default=(0.0, 0.0),
+        metavar=("LAT", "LON"),
+        help="camera point in degrees, longitude as in location descriptions",
+    )
+    parser.add_argument("--size", type=int, default=GLOBE_SIZE)
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO)
     logging.info("Приложение запущено")
 
-    neurosphere = Neurosphere("neurosphere/neurospheres/neurosphere0.json")
-    sphere = neurosphere.worlds[0]
-    sphere.statistics()
-    colors = sphere.generate_colors_by_biomes()
+    neurosphere = Neurosphere(args.neurosphere)
+    sphere = neurosphere.worlds[args.world]
+    logging.info(format_statistics(sphere.statistics()))
+    if args.layer is None:
+        colors = sphere.generate_colors_by_biomes()
+    else:
+        colors = sphere._get_layer_colors(args.layer)
+
+    if args.output:
+        latitude, longitude = np.deg2rad(args.view)
+        # in location descriptions longitude is shifted by 180 degrees
+        globe = render_globe(
+            sphere._index,
+            colors.astype(np.uint8),
+            latitude,
+            longitude + np.pi,
+            args.size,
+        )
+        write_image(args.output, globe)
+        logging.info(f"Вид на глобус сохранён: {args.output}")
+        return
+
     fig, ax = plot_sphere_points(sphere._points, colors)
     plt.show()
 
@@ -147,3 +166,7 @@ if __name__ == "__main__":
     #
     # fig, ax = plot_sphere_points(points, colors)
     # plt.show()
+
+
+if __name__ == "__main__":
+    main()